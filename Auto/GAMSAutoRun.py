@@ -36,7 +36,9 @@ Option                 Short  Parameter  Description
                                          If left empty, the plugin will attempt
                                          to log in itself.
 --gams-path            -G     GAMS_PATH  File path of the GAMS installation.
---gdx-file             -f     GDX_FILE   GDX file containing GAMS results
+--gdx-file             -f     GDX_FILE   GDX file containing GAMS results. By
+                                         default the results are read from
+                                         the output database of the model.
 
 **Optional arguments:**
 
@@ -45,6 +47,37 @@ Option                 Short  Parameter  Description
 ====================== ====== ========== =================================
 --group-nodes-by       -gn    GROUP_ATTR Group nodes by this attribute(s).
 --group_links-by       -gl    GROUP_ATTR Group links by this attribute(s).
+--precision            -pr    PRECISION  Number of decimals written for time
+                                         series values.
+--output-format        -of    FORMAT     Format of the exported input
+                                         data, text (default) or gdx. A
+                                         gdx file is read by the model
+                                         with $gdxin and $load.
+--workers              -w     WORKERS    Number of worker processes used
+                                         to build the result datasets.
+--cache-dir            -cd    CACHE_DIR  Directory of the export cache.
+                                         Unchanged exports are copied
+                                         from the cache.
+--cache-size           -cs    SIZE_MB    Maximum size of the export
+                                         cache in MB (default 1024).
+--fragment-dir         -fd    FRAG_DIR   Directory keeping the sections
+                                         of the last export. Only the
+                                         sections whose data changed are
+                                         generated again.
+--skip-includes        -si    PATTERN    Do not read included files
+                                         matching this pattern when
+                                         reading the model, e.g. the
+                                         exported data file, except for
+                                         their header and time index.
+--batch-size           -bs    BATCH_SIZE Save the results in batches of
+                                         at most this many datasets.
+--batch-bytes          -bb    BYTES      Save the results in batches of
+                                         at most this many bytes.
+--attr-cache           -ac    FILE       File keeping the attributes of
+                                         the server between runs.
+--attr-cache-ttl       -at    SECONDS    Age after which the attributes
+                                         in the attribute cache are
+                                         retrieved again (default 3600).
 ====================== ====== ========== =================================
 
 **Switches:**
@@ -56,6 +89,13 @@ Option                 Short  Description
                               on attributes only, default is export
                               data by attributes unless this option
                               is set.
+--sparse-connect       -sc    Export the connectivity matrix as a
+                              sparse parameter listing only existing
+                              connections.
+--in-memory            -im    Pass the exported data to the model as
+                              a GAMS database instead of writing an
+                              input file. The model reads it with
+                              $gdxin %hydra_data% and $load.
 ====================== ====== =========================================
 
 
@@ -102,11 +142,9 @@ Example:
 '''
 import sys
 import os
-import time
 import logging
+import multiprocessing
 import argparse as ap
-from datetime import datetime
-from dateutil import parser
 
 pythondir = os.path.dirname(os.path.realpath(__file__))
 gamslibpath=os.path.join(pythondir, '..', 'lib')
@@ -122,10 +160,13 @@ from HydraGAMSlib import check_lic
 from HydraGAMSlib import GamsModel
 
 from Exporter import GAMSExporter
+from ExportCache import ExportCache, FragmentStore
 from Importer import GAMSImporter
 
 log = logging.getLogger(__name__)
 
+steps = 18
+
 
 def commandline_parser():
     cmd_parser = ap.ArgumentParser(
@@ -166,7 +207,9 @@ def commandline_parser():
                         help='''Time axis for the modelling period (a list of
                         comma separated time stamps).''')
     cmd_parser.add_argument('-f', '--gdx-file',
-                        help='GDX file containing GAMS results.')
+                        help='''GDX file containing GAMS results. By default
+                        the results are read from the output database of the
+                        model run.''')
 
     cmd_parser.add_argument('-et', '--export_by_type',action='store_true',
                         help='''Use this switch to export data based on type, rather than attribute.''')
@@ -175,6 +218,67 @@ def commandline_parser():
                         help='''Specify the URL of the server to which this
                         plug-in connects.''')
 
+    cmd_parser.add_argument('-sc', '--sparse-connect', action='store_true',
+                        help='''Export the connectivity matrix as a sparse
+                        parameter listing only existing connections, instead of a
+                        full table of all nodes.''')
+
+    cmd_parser.add_argument('-pr', '--precision',
+                        help='''Number of decimals written for time series
+                        values. By default values are written with all their
+                        significant digits, or with six decimals when
+                        exporting by type.''')
+
+    cmd_parser.add_argument('-of', '--output-format', default='text',
+                        choices=['text', 'gdx'],
+                        help='''Format of the exported input data, a gams
+                        text file (default) or a gdx file.''')
+
+    cmd_parser.add_argument('-w', '--workers',
+                        help='''Number of worker processes used to build the
+                        result datasets. By default they are built in this
+                        process.''')
+
+    cmd_parser.add_argument('-si', '--skip-includes',
+                        help='''Do not read included files matching this pattern
+                        (e.g. the data file written by the exporter), except
+                        for their header and time index.''')
+
+    cmd_parser.add_argument('-bs', '--batch-size', type=int,
+                        help='''Save the results in batches of at most this many
+                        datasets. By default the whole scenario is saved at
+                        once.''')
+
+    cmd_parser.add_argument('-bb', '--batch-bytes', type=int,
+                        help='''Save the results in batches of at most this many
+                        bytes (of JSON encoded datasets).''')
+
+    cmd_parser.add_argument('-im', '--in-memory', action='store_true',
+                        help='''Pass the exported data to the model in memory
+                        as a GAMS database, instead of writing an input
+                        file. The model reads it with $gdxin %hydra_data%.''')
+
+    cmd_parser.add_argument('-cd', '--cache-dir',
+                        help='''Directory of the export cache. Unchanged
+                        exports are copied from the cache.''')
+
+    cmd_parser.add_argument('-cs', '--cache-size', default='1024',
+                        help='''Maximum size of the export cache in MB.''')
+
+    cmd_parser.add_argument('-fd', '--fragment-dir',
+                        help='''Directory keeping the sections of the last
+                        export. Only sections whose data changed are
+                        generated again.''')
+
+    cmd_parser.add_argument('-ac', '--attr-cache',
+                        help='''File keeping the attributes of the server, so
+                        that they are only retrieved again when the file is
+                        older than --attr-cache-ttl.''')
+
+    cmd_parser.add_argument('-at', '--attr-cache-ttl', default='3600',
+                        help='''Time in seconds after which the attributes in
+                        the attribute cache are retrieved again.''')
+
     cmd_parser.add_argument('-gd', '--gams_date_time_index', action='store_true',
                         help='''Set the time indexes to be timestamps which are compatible with gams date format (dd.mm.yyyy)''')
 
@@ -185,18 +289,6 @@ def commandline_parser():
     return cmd_parser
 
 
-def get_files_list(directory, ext):
-    '''
-    return list of files with specific ext on a folder with their last modified dates and times
-    '''
-    files_list={}
-    for file_ in os.listdir(directory):
-        if file_.endswith(ext):
-            absolute_path = os.stat(os.path.join(directory,file_))
-            files_list[file_]=time.ctime(absolute_path.st_mtime)
-    return files_list
-
-
 def get_input_file_name(gams_model):
     '''
     return  output data file name if it is not provided by the user
@@ -234,20 +326,59 @@ def get_input_file_name(gams_model):
     return inputfilename
 
 
-def export_network(is_licensed):
-    exporter = GAMSExporter(args)
+def get_export_cache(args):
+    """Return the export cache, or None if exports are not cached."""
+    if args.cache_dir is None or args.output is None or \
+            args.output.startswith('|'):
+        return None
+    return ExportCache(args.cache_dir,
+                       max_size=int(args.cache_size) * 1024 * 1024)
 
-    write_progress(2, steps)
 
-    exporter.get_network(is_licensed)
+def export_network(args, is_licensed, exporter=None, net=None):
+    """
+    Export the network. ``exporter`` and ``net`` are an exporter and a
+    network already retrieved with it, e.g. with the data of several
+    scenarios.
+    """
+    if exporter is None:
+        exporter = GAMSExporter(args)
 
-    write_progress(3, steps)
+    write_progress(2, steps)
 
-    exporter.export_network()
+    exporter.get_network(is_licensed, net=net)
 
     if(args.gams_date_time_index is True):
             exporter.use_gams_date_index=True
 
+    if args.in_memory is True:
+        # The data is added to the database of the model in run_gams_model
+        return exporter
+
+    cache = get_export_cache(args)
+    if cache is not None:
+        cache_key = exporter.get_cache_key(export_by_type=args.export_by_type,
+                                           output_format=args.output_format)
+        if cache.get(cache_key, args.output):
+            # The time index is still needed to import the results
+            exporter.set_time_index()
+            write_progress(5, steps)
+            return exporter
+
+    if args.output_format == 'gdx':
+        write_progress(3, steps)
+        exporter.export_gdx(gams_path=args.gams_path)
+        if cache is not None:
+            cache.put(cache_key, args.output)
+        write_progress(5, steps)
+        return exporter
+
+    write_progress(3, steps)
+
+    if args.fragment_dir is not None:
+        exporter.fragments = FragmentStore(args.fragment_dir)
+    exporter.export_network()
+
     write_progress(4, steps)
     exporter.write_time_index()
 
@@ -260,12 +391,17 @@ def export_network(is_licensed):
     write_output("Writing output file")
 
     exporter.write_file()
+    if cache is not None:
+        cache.put(cache_key, args.output)
     return exporter
 
 
-def run_gams_model(args):
+def run_gams_model(args, exporter):
+    '''
+    Run the model and return the database of its results, which is read
+    by the importer unless a result file is given with --gdx-file.
+    '''
     log.info("Running GAMS model .....")
-    cur_time=datetime.now().replace(microsecond=0)
     write_progress(6, steps)
     working_directory=os.path.dirname(args.gms_file)
 
@@ -273,48 +409,50 @@ def run_gams_model(args):
         working_directory = '.'
 
     model = GamsModel(args.gams_path, working_directory)
+    if args.in_memory is True:
+        write_progress(5, steps)
+        exporter.export_database(model.add_database())
     write_progress(7, steps)
     model.add_job(args.gms_file)
     write_progress(8, steps)
     model.run()
     write_progress(9, steps)
     log.info("Running GAMS model finsihed")
-    # if result file is not provided, it looks for it automatically at GAMS WD
     if args.gdx_file is None:
-        log.info("Extracting results from %s.", working_directory)
-        files_list=get_files_list(working_directory, '.gdx')
-        for file_ in files_list:
-            dt = parser.parse(files_list[file_])
-            delta = (dt-cur_time).total_seconds()
-            if delta>=0:
-                args.gdx_file = os.path.join(working_directory, file_)
-        if args.gdx_file is None:
-              raise HydraPluginError('Result file is not provided/found.')
-
-
-def read_results(is_licensed, args, network, connection):
+        log.info("Reading results from the output database of the model.")
+        return model.job.out_db
+
+
+def read_results(is_licensed, args, network, connection, exporter=None,
+                 out_db=None):
     """
         Instantiate a GAMSImport class, assign the network, read the
-        gdx and gms files, update the network's data and then save
-        the network.
+        gms file and the results (the gdx file or the output database of
+        the model), update the network's data and then save the network.
+        If the input data was exported to a gdx file, the time index is
+        taken from the exporter.
     """
     write_progress(10, steps)
     gdximport = GAMSImporter(args, connection)
 
     write_progress(11, steps)
-    gdximport.load_gams_file(args.gms_file)
+    gdximport.load_gams_file(args.gms_file, args.skip_includes)
 
     write_progress(12, steps)
     gdximport.set_network(is_licensed, network)
 
     write_progress(13, steps)
-    gdximport.parse_time_index()
-
-    write_progress(14, steps)
-    gdximport.open_gdx_file(args.gdx_file)
+    if (args.output_format == 'gdx' or args.in_memory is True) and exporter is not None:
+        gdximport.set_time_axis(exporter.time_index, exporter.use_gams_date_index)
+    else:
+        gdximport.parse_time_index()
 
-    write_progress(15, steps)
-    gdximport.read_gdx_data()
+    if out_db is not None:
+        write_progress(15, steps)
+        gdximport.read_database(out_db)
+    else:
+        write_progress(14, steps)
+        gdximport.open_gdx_file(args.gdx_file)
 
     write_progress(16, steps)
     gdximport.parse_variables('variables')
@@ -324,10 +462,14 @@ def read_results(is_licensed, args, network, connection):
     gdximport.parse_variables('parameters')
 
     write_progress(17, steps)
-    gdximport.assign_attr_data()
+    if args.workers is not None:
+        gdximport.assign_attr_data(workers=int(args.workers))
+    else:
+        gdximport.assign_attr_data()
 
     write_progress(18, steps)
-    gdximport.save()
+    gdximport.save(batch_size=args.batch_size,
+                   batch_bytes=args.batch_bytes)
 
 
 def check_args(args):
@@ -344,6 +486,9 @@ def check_args(args):
         raise HydraPluginError('Gams file is not specifed.')
     elif os.path.isfile(os.path.expanduser(args.gms_file))==False:
         raise HydraPluginError('Gams file '+args.gms_file+' not found.')
+    elif args.in_memory is True:
+        # No input file is written
+        return
     elif args.output==None:
         args.output=get_input_file_name(args.gms_file)
         if args.output is None:
@@ -353,17 +498,18 @@ def check_args(args):
 
 
 if __name__ == '__main__':
+    # Needed by the worker processes of the frozen executable
+    multiprocessing.freeze_support()
     try:
         is_licensed = check_lic()
-        steps = 18
         write_progress(1, steps)
         cmd_parser = commandline_parser()
         args = cmd_parser.parse_args()
         check_args(args)
-        exporter=export_network(is_licensed)
-        run_gams_model(args)
+        exporter=export_network(args, is_licensed)
+        out_db = run_gams_model(args, exporter)
         #if the mode is Auto, it will get the network from the exporter
-        read_results(is_licensed, args, exporter.hydranetwork, exporter.connection)
+        read_results(is_licensed, args, exporter.hydranetwork, exporter.connection, exporter, out_db)
         message = "Run successfully"
         errors  = []
 
@@ -0,0 +1,526 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+'''
+
+plugin_name: GAMS batch run
+            - Run GAMSAuto for several networks and scenarios at once.
+
+Every run exports a scenario, solves the model and imports the results, like
+GAMSAutoRun. The runs are distributed over a pool of worker processes. Each
+run has its own working directory, ``<job-dir>/network_<id>_scenario_<id>``,
+which holds the exported data, a copy of the model and the files written by
+GAMS, so that several runs of the same model don't overwrite each other.
+
+All arguments of GAMSAutoRun are accepted, except --network and --scenario,
+which are given as a list of runs instead.
+
+**Batch arguments:**
+
+====================== ====== ========== ======================================
+Option                 Short  Parameter  Description
+====================== ====== ========== ======================================
+--runs                 -rn    RUNS       Runs as NETWORK:SCENARIO pairs, e.g.
+                                         4:10 4:11 5:12. A run can also be
+                                         given as SCENARIO only, for the
+                                         network given with --network.
+--job-dir              -jd    JOB_DIR    Directory in which the working
+                                         directories of the runs are created.
+                                         Defaults to the model directory.
+--processes            -np    PROCESSES  Number of runs executed at the same
+                                         time (default 2). Runs in these
+                                         processes ignore --workers, which is
+                                         only used with --pipeline.
+--queue-size           -qs    QUEUE_SIZE Maximum number of runs submitted to
+                                         the pool and not yet finished.
+                                         Defaults to twice the number of
+                                         processes. With --pipeline, the
+                                         number of runs waiting between two
+                                         stages (default 1).
+--stage-workers        -sw    WORKERS    Number of threads of each stage of
+                                         the pipeline, e.g. fetch=2,solve=3.
+                                         The stages are fetch, export, solve
+                                         and import, by default each has one
+                                         thread.
+====================== ====== ========== ======================================
+
+**Switches:**
+
+====================== ====== =========================================
+Option                 Short  Description
+====================== ====== =========================================
+--pipeline             -pl    Execute the runs in one process as a
+                              pipeline of threads, instead of a pool of
+                              processes. While a run is solved, the next
+                              run is retrieved and exported and the
+                              results of the previous run are imported.
+                              When a stage falls behind, the stages
+                              before it wait.
+--hot-solve            -hs    Compile the model once per network. The
+                              model is run up to the line
+                              *$hydra_checkpoint with the data of the
+                              first scenario and saved to a checkpoint;
+                              every scenario then runs the rest of the
+                              model from the checkpoint, loading only
+                              the parameters which differ from the
+                              first scenario. Values the model
+                              calculates from those parameters before
+                              the marker keep the values of the first
+                              scenario, so the marker must come before
+                              any such calculation. Models without the
+                              marker are run for each scenario. Data
+                              must be exported by attribute.
+====================== ====== =========================================
+
+The output file (--output, or the file included by the model) is written to
+the working directory of each run under the same name, and the copy of the
+model includes it from there, also if the model includes it from a
+subdirectory. A fragment directory (--fragment-dir) gets one
+subdirectory per run.
+
+Example:
+=========
+        -m "c:\\temp\\Demo2.gms" -tx 2000-01-01, 2000-02-01, 2000-03-01 -rn 4:4 4:5 4:6 -np 3
+
+
+'''
+import sys
+import os
+import copy
+import logging
+import collections
+import multiprocessing
+
+pythondir = os.path.dirname(os.path.realpath(__file__))
+gamslibpath=os.path.join(pythondir, '..', 'lib')
+api_path = os.path.realpath(gamslibpath)
+if api_path not in sys.path:
+    sys.path.insert(0, api_path)
+
+##########################
+
+from hydra_base.exceptions import HydraPluginError
+from hydra_client.output import write_output, create_xml_response
+from HydraGAMSlib import check_lic, copy_model, GamsModel, checkpoint_marker
+from SymbolWriter import SymbolRecorder, DatabaseSymbolWriter
+from Exporter import GAMSExporter
+from Pipeline import Stage, Pipeline
+
+from GAMSAutoRun import commandline_parser, get_input_file_name, \
+        export_network, run_gams_model, read_results
+
+log = logging.getLogger(__name__)
+
+
+def batch_commandline_parser():
+    cmd_parser = commandline_parser()
+    cmd_parser.description = """ Export several scenarios from Hydra, run
+                    GAMS for each of them and import the results into Hydra,
+                    running several scenarios in parallel.
+                    (c) Copyright 2014, Univeristy of Manchester.
+        """
+
+    cmd_parser.add_argument('-rn', '--runs', nargs='+',
+                        help='''Runs as NETWORK:SCENARIO pairs, or scenario
+                        ids of the network given with --network.''')
+    cmd_parser.add_argument('-jd', '--job-dir',
+                        help='''Directory in which the working directory of
+                        each run is created. Defaults to the model
+                        directory.''')
+    cmd_parser.add_argument('-np', '--processes', type=int, default=2,
+                        help='''Number of runs executed at the same time.
+                        --workers is ignored for runs in these processes,
+                        it is only used with --pipeline.''')
+    cmd_parser.add_argument('-qs', '--queue-size', type=int,
+                        help='''Maximum number of runs waiting for or being
+                        executed by the workers. Defaults to twice the number
+                        of processes. With --pipeline, the number of runs
+                        waiting between two stages (default 1).''')
+    cmd_parser.add_argument('-pl', '--pipeline', action='store_true',
+                        help='''Execute the runs in one process as a pipeline
+                        of fetch, export, solve and import stages, so that
+                        the stages of consecutive runs overlap.''')
+    cmd_parser.add_argument('-sw', '--stage-workers', nargs='+',
+                        help='''Number of threads of each pipeline stage,
+                        e.g. fetch=2,solve=3. By default each stage has one
+                        thread.''')
+    cmd_parser.add_argument('-hs', '--hot-solve', action='store_true',
+                        help='''Compile the model once per network and solve
+                        each scenario from a checkpoint, loading only the
+                        parameters which differ from the first scenario. The
+                        model is run up to a line *$hydra_checkpoint, which
+                        must come before any calculation using scenario data;
+                        values calculated before it are not updated. Models
+                        without this line are run for each scenario.''')
+    return cmd_parser
+
+
+def get_runs(args):
+    """
+    Return the (network id, scenario id) pairs given on the command line.
+    """
+    runs = []
+    for run in ','.join(args.runs or []).split(','):
+        run = run.strip()
+        if run == '':
+            continue
+        if ':' in run:
+            network_id, scenario_id = run.split(':', 1)
+        else:
+            network_id, scenario_id = args.network_id, run
+        try:
+            runs.append((int(network_id), int(scenario_id)))
+        except (TypeError, ValueError):
+            raise HydraPluginError('Invalid run %s. Runs are given as '
+                                   'NETWORK:SCENARIO.' % run)
+    if len(runs) == 0:
+        raise HydraPluginError('No runs are specified.')
+    return runs
+
+
+def get_job_args(args, network_id, scenario_id):
+    """
+    Return the arguments of one run, with the output written to the working
+    directory of the run.
+    """
+    job_args = copy.copy(args)
+    job_args.network_id = str(network_id)
+    job_args.scenario_id = str(scenario_id)
+
+    job_dir = os.path.join(args.job_dir, 'network_%s_scenario_%s' %
+                           (network_id, scenario_id))
+    if not os.path.isdir(job_dir):
+        os.makedirs(job_dir)
+    job_args.job_dir = job_dir
+
+    if args.output is not None:
+        job_args.output = os.path.join(job_dir, os.path.basename(args.output))
+    if args.gdx_file is not None and not os.path.isabs(args.gdx_file):
+        job_args.gdx_file = os.path.join(job_dir, args.gdx_file)
+    if args.fragment_dir is not None:
+        job_args.fragment_dir = os.path.join(args.fragment_dir,
+                                             os.path.basename(job_dir))
+    return job_args
+
+
+def get_error_message(e):
+    if isinstance(e, HydraPluginError):
+        return e.message
+    if e.message == '' and hasattr(e, 'strerror'):
+        return str(e.strerror)
+    return str(e.message or e)
+
+
+def run_job(args, is_licensed, network_id, scenario_id):
+    """
+    Export, solve and import one scenario. This runs in a worker process and
+    returns a list of (scenario id, error), which is empty if the run
+    succeeded.
+    """
+    try:
+        job_args = get_job_args(args, network_id, scenario_id)
+        exporter = export_network(job_args, is_licensed)
+        # The copy of the model includes the data exported for this run
+        job_args.gms_file = copy_model(args.gms_file, job_args.job_dir,
+                                       job_args.output)
+        out_db = run_gams_model(job_args, exporter)
+        read_results(is_licensed, job_args, exporter.hydranetwork,
+                     exporter.connection, exporter, out_db)
+        return []
+    except Exception as e:
+        log.exception(e)
+        return [(scenario_id, get_error_message(e))]
+
+
+def run_hot_solve(args, is_licensed, network_id, scenario_ids):
+    """
+    Solve several scenarios of a network, compiling the model only once.
+    The first scenario is exported and the model is run up to its
+    *$hydra_checkpoint line and saved to a checkpoint. Every scenario is
+    then solved from the checkpoint, with only the parameters which differ
+    from the first scenario loaded (see GamsModel.add_checkpoint_job).
+    Scenarios whose sets differ from the first one, or all scenarios if the
+    model has no checkpoint line, are run on their own.
+    Returns a list of (scenario id, error).
+    """
+    with open(args.gms_file) as f:
+        checkpoint_line = GamsModel.get_checkpoint_line(f.read().split("\n"))
+    if checkpoint_line is None:
+        log.warning("The model has no %s line, running each scenario on its "
+                    "own.", checkpoint_marker)
+        errors = []
+        for scenario_id in scenario_ids:
+            errors.extend(run_job(args, is_licensed, network_id, scenario_id))
+        return errors
+
+    base_id = scenario_ids[0]
+    try:
+        job_args = get_job_args(args, network_id, base_id)
+        base_exporter = GAMSExporter(job_args)
+        net = base_exporter.fetch_network(scenario_ids)
+        export_network(job_args, is_licensed, exporter=base_exporter, net=net)
+        job_args.gms_file = copy_model(args.gms_file, job_args.job_dir,
+                                       job_args.output)
+
+        model = GamsModel(args.gams_path, job_args.job_dir)
+        if args.in_memory is True:
+            base_exporter.export_database(model.add_database())
+        model.add_checkpoint_job(job_args.gms_file)
+        model.run_checkpoint()
+
+        base_symbols = SymbolRecorder()
+        base_exporter.export_symbols(base_symbols)
+    except Exception as e:
+        log.exception(e)
+        return [(scenario_id, get_error_message(e))
+                for scenario_id in scenario_ids]
+
+    errors = []
+    for scenario_id in scenario_ids:
+        try:
+            scenario_args = copy.copy(job_args)
+            scenario_args.scenario_id = str(scenario_id)
+            if scenario_id == base_id:
+                exporter = base_exporter
+                out_db = model.run_scenario()
+            else:
+                scenario_args.output = None
+                exporter = GAMSExporter(scenario_args,
+                                        connection=base_exporter.connection,
+                                        attrs=base_exporter.attrs)
+                exporter.get_network(is_licensed, net=net)
+                exporter.use_gams_date_index = base_exporter.use_gams_date_index
+                symbols = SymbolRecorder()
+                exporter.export_symbols(symbols)
+                parameters = symbols.get_changed_parameters(base_symbols)
+                if parameters is None:
+                    log.info("The sets of scenario %s differ from scenario %s,"
+                             " running it on its own.", scenario_id, base_id)
+                    errors.extend(run_job(args, is_licensed, network_id,
+                                          scenario_id))
+                    continue
+                log.info("Solving scenario %s with %s modified parameters",
+                         scenario_id, len(parameters))
+                database = model.add_scenario_database()
+                symbols.write_parameters(DatabaseSymbolWriter(database),
+                                         parameters)
+                out_db = model.run_scenario(database, parameters)
+            read_results(is_licensed, scenario_args, exporter.hydranetwork,
+                         exporter.connection, exporter, out_db)
+        except Exception as e:
+            log.exception(e)
+            errors.append((scenario_id, get_error_message(e)))
+    return errors
+
+
+def run_batch(args, runs, is_licensed):
+    """
+    Execute all runs in a pool of ``args.processes`` workers. At most
+    ``args.queue_size`` jobs are submitted to the pool at any time, new jobs
+    are only submitted once the oldest one has finished. A job is one run,
+    or all runs of a network with --hot-solve.
+    Returns the runs which failed and their errors.
+    """
+    processes = max(1, args.processes)
+    queue_size = args.queue_size or 2 * processes
+    failed = []
+    errors = []
+    pending = collections.deque()
+
+    if args.hot_solve is True:
+        networks = collections.OrderedDict()
+        for network_id, scenario_id in runs:
+            networks.setdefault(network_id, []).append(scenario_id)
+        jobs = [(run_hot_solve, network_id, scenario_ids)
+                for network_id, scenario_ids in networks.items()]
+    else:
+        jobs = [(run_job, network_id, scenario_id)
+                for network_id, scenario_id in runs]
+
+    def wait_for_oldest():
+        network_id, scenario_ids, result = pending.popleft()
+        for scenario_id, error in result.get():
+            if (network_id, scenario_id) not in failed:
+                failed.append((network_id, scenario_id))
+            errors.append('Network %s, scenario %s: %s' %
+                          (network_id, scenario_id, error))
+        write_output("Finished network %s, scenario %s" %
+                     (network_id, scenario_ids))
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for function, network_id, scenario_ids in jobs:
+            if len(pending) >= queue_size:
+                wait_for_oldest()
+            result = pool.apply_async(function, (args, is_licensed,
+                                                 network_id, scenario_ids))
+            pending.append((network_id, scenario_ids, result))
+        while len(pending) > 0:
+            wait_for_oldest()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return failed, errors
+
+
+pipeline_stages = ('fetch', 'export', 'solve', 'import')
+
+
+class PipelineRun(object):
+    """
+    The state of a run while it passes through the stages of run_pipeline.
+    """
+
+    def __init__(self, network_id, scenario_id):
+        self.network_id = network_id
+        self.scenario_id = scenario_id
+        self.args = None
+        self.exporter = None
+        self.net = None
+        self.out_db = None
+
+
+def get_stage_workers(args):
+    """
+    Return the number of threads of each pipeline stage, given as e.g.
+    fetch=2,solve=3. Stages which aren't given have one thread.
+    """
+    workers = collections.OrderedDict((name, 1) for name in pipeline_stages)
+    for option in ','.join(args.stage_workers or []).split(','):
+        if option.strip() == '':
+            continue
+        name, _, count = option.partition('=')
+        name = name.strip().lower()
+        if name not in workers:
+            raise HydraPluginError('Unknown pipeline stage %s. The stages are'
+                                   ' %s.' % (name, ', '.join(pipeline_stages)))
+        try:
+            workers[name] = int(count)
+        except ValueError:
+            raise HydraPluginError('Invalid number of workers for stage %s: '
+                                   '%s' % (name, count))
+    return workers
+
+
+def run_pipeline(args, runs, is_licensed):
+    """
+    Execute all runs in one process as a pipeline of threads: while one run
+    is solved, the network of the next one is retrieved and exported and the
+    results of the previous one are imported. The number of threads of each
+    stage is set with --stage-workers, at most ``args.queue_size`` runs wait
+    between two stages.
+    Returns the runs which failed and their errors.
+    """
+    def fetch(run):
+        run.args = get_job_args(args, run.network_id, run.scenario_id)
+        run.exporter = GAMSExporter(run.args)
+        run.net = run.exporter.fetch_network()
+
+    def export(run):
+        export_network(run.args, is_licensed, exporter=run.exporter,
+                       net=run.net)
+        # The copy of the model includes the data exported for this run
+        run.args.gms_file = copy_model(args.gms_file, run.args.job_dir,
+                                       run.args.output)
+
+    def solve(run):
+        run.out_db = run_gams_model(run.args, run.exporter)
+
+    def import_results(run):
+        read_results(is_licensed, run.args, run.exporter.hydranetwork,
+                     run.exporter.connection, run.exporter, run.out_db)
+        write_output("Finished network %s, scenario %s" %
+                     (run.network_id, run.scenario_id))
+        # Release the data of the run
+        run.exporter = run.net = run.out_db = None
+
+    workers = get_stage_workers(args)
+    functions = {'fetch': fetch, 'export': export, 'solve': solve,
+                 'import': import_results}
+    stages = [Stage(name, functions[name], workers[name])
+              for name in pipeline_stages]
+    pipeline = Pipeline(stages, queue_size=args.queue_size or 1)
+    pipeline_errors = pipeline.run(PipelineRun(network_id, scenario_id)
+                                   for network_id, scenario_id in runs)
+
+    failed = []
+    errors = []
+    for run, stage, e in pipeline_errors:
+        failed.append((run.network_id, run.scenario_id))
+        errors.append('Network %s, scenario %s (%s): %s' %
+                      (run.network_id, run.scenario_id, stage,
+                       get_error_message(e)))
+    return failed, errors
+
+
+def check_args(args):
+    if args.gms_file is None:
+        raise HydraPluginError('Gams file is not specifed.')
+    elif os.path.isfile(os.path.expanduser(args.gms_file))==False:
+        raise HydraPluginError('Gams file '+args.gms_file+' not found.')
+    args.gms_file = os.path.abspath(os.path.expanduser(args.gms_file))
+
+    if args.job_dir is None:
+        args.job_dir = os.path.dirname(args.gms_file)
+    args.job_dir = os.path.abspath(args.job_dir)
+
+    if args.hot_solve is True and args.export_by_type is True:
+        raise HydraPluginError('Data exported by type can not be modified '
+                               'for a hot solve, please export by attribute.')
+
+    if args.hot_solve is True and args.pipeline is True:
+        raise HydraPluginError('--hot-solve and --pipeline can not be used '
+                               'together.')
+
+    if args.workers is not None and args.pipeline is not True:
+        # The runs already execute in worker processes of a pool, which
+        # can't start processes of their own
+        log.warning("--workers is ignored unless --pipeline is used, the "
+                    "results are built in the process of each run.")
+        args.workers = None
+
+    if args.in_memory is not True and args.output is None:
+        args.output = get_input_file_name(args.gms_file)
+        if args.output is None:
+            raise HydraPluginError('No output file specified')
+
+
+if __name__ == '__main__':
+    # Needed by the worker processes of the frozen executable
+    multiprocessing.freeze_support()
+    runs = []
+    try:
+        is_licensed = check_lic()
+        cmd_parser = batch_commandline_parser()
+        args = cmd_parser.parse_args()
+        check_args(args)
+        runs = get_runs(args)
+        if args.pipeline is True:
+            failed, errors = run_pipeline(args, runs, is_licensed)
+        else:
+            failed, errors = run_batch(args, runs, is_licensed)
+        if len(failed) == 0:
+            message = "Run successfully"
+        else:
+            message = "%s of %s runs failed" % (len(failed), len(runs))
+
+    except HydraPluginError as e:
+        log.exception(e)
+        errors = [e.message]
+        message = "An error has occurred"
+    except Exception as e:
+        errors = []
+        if e.message == '':
+            if hasattr(e, 'strerror'):
+                errors = [e.strerror]
+        else:
+            errors = [e.message]
+        log.exception(e)
+        message = "An unknown error has occurred"
+
+    network_ids = sorted(set(network_id for network_id, scenario_id in runs))
+    text = create_xml_response('GAMSBatchRun', ','.join(map(str, network_ids)),
+                               [scenario_id for network_id, scenario_id in runs],
+                               message=message, errors=errors)
+    print(text)
@@ -19,11 +19,15 @@ Option                 Short   Parameter  Description
 --network              -t      NETWORK    ID of the network that will be
                                           exported.
 --scenario             -s      SCENARIO   ID of the scenario that will be
-                                          exported.
+                                          exported, or a comma separated list
+                                          of scenario ids (see below).
 --template-id          -tp     TEMPLATE   ID of the template used for exporting
                                           resources. Attributes that don't
                                           belong to this template are ignored.
---output               -o      OUTPUT     Filename of the output file.
+--output               -o      OUTPUT     Filename of the output file. A name
+                                          ending in .gz is written gzip
+                                          compressed, a name starting with |
+                                          is piped to the given command.
 ====================== ======= ========== ======================================
 
 **Optional arguments:**
@@ -33,6 +37,23 @@ Option                 Short   Parameter  Description
 ====================== ======= ========== ======================================
 --group-nodes-by       -gn     GROUP_ATTR Group nodes by this attribute(s).
 --group_links-by       -gl     GROUP_ATTR Group links by this attribute(s).
+--precision            -pr     PRECISION  Number of decimals written for time
+                                          series values.
+--output-format        -of     FORMAT     Format of the output file, text
+                                          (default) or gdx (see below).
+--gams-path            -G      GAMS_PATH  File path of the GAMS installation,
+                                          used to write gdx files.
+--cache-dir            -cd     CACHE_DIR  Directory of the export cache (see
+                                          below).
+--cache-size           -cs     SIZE_MB    Maximum size of the export cache in
+                                          MB (default 1024).
+--fragment-dir         -fd     FRAG_DIR   Directory keeping the sections of
+                                          the last export (see below).
+--attr-cache           -ac     FILE       File keeping the attributes of the
+                                          server between runs.
+--attr-cache-ttl       -at     SECONDS    Age after which the attributes in
+                                          the attribute cache are retrieved
+                                          again (default 3600).
 ====================== ======= ========== ======================================
 
 **Switches:**
@@ -44,6 +65,8 @@ Option                 Short  Description
                               on attributes only, default is export
                               data by attributes unless this option
                               is set.
+--sparse-connect       -sc    Export the connectivity matrix as a
+                              sparse parameter (see below).
 ====================== ====== =========================================
 
 
@@ -120,6 +143,16 @@ In addition to links, GAMSExport provides a connectivity matrx::
     NodeB               0         0         1
     NodeC               0         0         0
 
+For large networks the table is mostly zeros. With the ``--sparse-connect``
+switch only existing connections are exported and GAMS sets all other entries
+to zero::
+
+    * Connectivity matrix.
+    Parameter Connect(i,j) /
+    NodeA . NodeB   1
+    NodeB . NodeC   1
+    /;
+
 
 Nodes and links are also grouped by node type::
 
@@ -254,6 +287,54 @@ Arrays:
     presents us with a real-world problem that needs arrays with more than 26
     dimensions.
 
+GDX output
+~~~~~~~~~~
+
+With ``--output-format gdx`` the same sets and parameters are written to a GDX
+file, which the model reads with ``$gdxin`` and ``$load`` instead of
+``$include``. GAMS does not need to parse the data, which is much faster for
+large networks. Data is always written by attribute, the connectivity matrix
+is always sparse and descriptors which are not numbers are skipped. Writing
+gdx files needs the GAMS python API (gdxcc)::
+
+    $gdxin input.gdx
+    $load i links t timestamp Connect
+
+Index file
+~~~~~~~~~~
+
+Next to a text output file the exporter writes ``<output>.json`` with the
+network and scenario id, the time axis and the names of all nodes and links.
+When results are imported, GAMSImport reads the time axis from this file
+instead of parsing it from the data file.
+
+Exporting several scenarios
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+If a list of scenario ids is given (e.g. ``-s 3,4,5``), the network is
+retrieved once with the data of all scenarios and one file is written per
+scenario, named after the output file and the scenario id (``data_3.dat``,
+``data_4.dat``, ...). The sections of the network, like the node and link
+sets, the connectivity and the time index, are only generated once. With
+``--fragment-dir`` data sections which are the same in several scenarios are
+also shared.
+
+Export cache
+~~~~~~~~~~~~
+
+With ``--cache-dir`` every export is stored in a cache, keyed on a hash of the
+network and scenario data, the template, the time axis and the export
+options. If nothing changed since an earlier export, the cached file is copied
+to the output instead of exporting the data again. The least recently used
+exports are removed when the cache grows larger than ``--cache-size``.
+
+With ``--fragment-dir`` each section of a text export (sets, connectivity,
+coordinates, time index and the data of each data type) is also stored in
+this directory, with a fingerprint of the data it was generated from. When
+the scenario is exported again, only the sections whose data changed are
+generated, all others are copied from the directory. Use one directory per
+network, as only the sections of the last export are kept.
+
 Examples:
 =========
 Exporting use time axis:
@@ -262,11 +343,13 @@ Exporting use time axis:
 Exporting use start time, end time and time step:
 
  python GAMSExport.py -t 40 -s 40  -st 2015-04-01 -en  2039-04-01 -dt "1 yr"  -o "c:\temp\CH2M_2.dat" -et
+ python GAMSExport.py -t 4 -s 4 -st 2015-04-01 -en 2039-04-01 -dt "1 yr" -of gdx -o "c:\temp\input.gdx"
  python GAMSExport.py -s 37 -t 37 -o "F:\work\CAL_Model\csv data for California model\excel files final\input_f.txt" -st "1922-01-01"  -en "1993-12-01" -dt "1 mon"
 """
 
 import sys
 import os
+import copy
 import argparse as ap
 import logging
 
@@ -285,6 +368,7 @@ from hydra_client.output import write_progress, write_output, create_xml_respons
 from HydraGAMSlib import check_lic
 from License import LicencePluginError
 from Exporter import GAMSExporter
+from ExportCache import ExportCache, FragmentStore
 
 
 log = logging.getLogger(__name__)
@@ -300,7 +384,8 @@ def commandline_parser():
     parser.add_argument('-t', '--network-id',
                         help='''ID of the network that will be exported.''')
     parser.add_argument('-s', '--scenario-id',
-                        help='''ID of the scenario that will be exported.''')
+                        help='''ID of the scenario that will be exported, or
+                        a comma separated list of scenario ids.''')
     parser.add_argument('-tp', '--template-id',
                         help='''ID of the template to be used.''')
 
@@ -327,6 +412,47 @@ def commandline_parser():
     parser.add_argument('-et', '--export_by_type', action='store_true',
                         help='''to export data based on types, set this otion to 'y' or 'yes', default is export data by attributes.''')
 
+    parser.add_argument('-sc', '--sparse-connect', action='store_true',
+                        help='''Export the connectivity matrix as a sparse
+                        parameter listing only existing connections, instead of a
+                        full table of all nodes.''')
+
+    parser.add_argument('-pr', '--precision',
+                        help='''Number of decimals written for time series
+                        values. By default values are written with all their
+                        significant digits, or with six decimals when
+                        exporting by type.''')
+
+    parser.add_argument('-of', '--output-format', default='text',
+                        choices=['text', 'gdx'],
+                        help='''Format of the output file, a gams text file
+                        (default) or a gdx file.''')
+
+    parser.add_argument('-G', '--gams-path',
+                        help='''File path of the GAMS installation, used to
+                        write gdx files.''')
+
+    parser.add_argument('-cd', '--cache-dir',
+                        help='''Directory of the export cache. Unchanged
+                        exports are copied from the cache.''')
+
+    parser.add_argument('-cs', '--cache-size', default='1024',
+                        help='''Maximum size of the export cache in MB.''')
+
+    parser.add_argument('-fd', '--fragment-dir',
+                        help='''Directory keeping the sections of the last
+                        export. Only sections whose data changed are
+                        generated again.''')
+
+    parser.add_argument('-ac', '--attr-cache',
+                        help='''File keeping the attributes of the server, so
+                        that they are only retrieved again when the file is
+                        older than --attr-cache-ttl.''')
+
+    parser.add_argument('-at', '--attr-cache-ttl', default='3600',
+                        help='''Time in seconds after which the attributes in
+                        the attribute cache are retrieved again.''')
+
     parser.add_argument('-gd', '--gams_date_time_index', action='store_true',
                         help='''Set the time indexes to be timestamps which are compatible with gams date format (dd.mm.yyyy)''')
 
@@ -340,22 +466,99 @@ def commandline_parser():
     return parser
 
 
-def export_network(args, is_licensed):
+def get_export_cache(args):
+    """Return the export cache, or None if exports are not cached."""
+    if args.cache_dir is None or args.output is None or \
+            args.output.startswith('|'):
+        return None
+    return ExportCache(args.cache_dir,
+                       max_size=int(args.cache_size) * 1024 * 1024)
+
+
+def get_scenario_ids(args):
+    """Return the list of scenario ids given with --scenario-id."""
+    return [int(scenario_id) for scenario_id in
+            str(args.scenario_id).split(',') if scenario_id.strip() != '']
+
+
+def get_scenario_file_name(filename, scenario_id):
+    """Return the output file name of one scenario of a batch export, e.g.
+    data_3.dat for data.dat."""
+    root, ext = os.path.splitext(filename)
+    if ext.lower() == '.gz':
+        root, ext2 = os.path.splitext(root)
+        ext = ext2 + ext
+    return '%s_%s%s' % (root, scenario_id, ext)
+
+
+def export_scenarios(args, scenario_ids, is_licensed):
+    """
+    Export several scenarios of a network to one file each. The network is
+    retrieved once with the data of all scenarios, and sections which are
+    the same in all scenarios are only generated once.
+    """
+    net = None
+    if args.fragment_dir is not None:
+        fragments = FragmentStore(args.fragment_dir)
+    else:
+        # Keeping the data sections in memory would keep the data of all
+        # scenarios until the last one is exported
+        fragments = FragmentStore(sections=GAMSExporter.topology_sections)
+    for scenario_id in scenario_ids:
+        scenario_args = copy.copy(args)
+        scenario_args.scenario_id = scenario_id
+        scenario_args.output = get_scenario_file_name(args.output, scenario_id)
+        if net is None:
+            exporter = GAMSExporter(scenario_args)
+            net = exporter.fetch_network(scenario_ids)
+        else:
+            exporter = GAMSExporter(scenario_args,
+                                    connection=exporter.connection,
+                                    attrs=exporter.attrs)
+        log.info("Exporting scenario %s to %s", scenario_id,
+                 scenario_args.output)
+        export_network(scenario_args, is_licensed, exporter=exporter, net=net,
+                       fragments=fragments)
+
+
+def export_network(args, is_licensed, exporter=None, net=None, fragments=None):
 
         write_progress(2, steps)
-        exporter = GAMSExporter(args)
+        if exporter is None:
+            exporter = GAMSExporter(args)
 
 
         write_progress(3, steps)
-        exporter.get_network(is_licensed)
+        exporter.get_network(is_licensed, net=net)
+
+        if(args.gams_date_time_index is True):
+            exporter.use_gams_date_index=True
+
+        cache = get_export_cache(args)
+        if cache is not None:
+            cache_key = exporter.get_cache_key(
+                export_by_type=args.export_by_type,
+                output_format=args.output_format)
+            if cache.get(cache_key, args.output):
+                write_progress(7, steps)
+                return
+
+        if args.output_format == 'gdx':
+            write_progress(4, steps)
+            exporter.export_gdx(gams_path=args.gams_path)
+            if cache is not None:
+                cache.put(cache_key, args.output)
+            write_progress(7, steps)
+            return
 
         write_progress(4, steps)
+        if fragments is not None:
+            exporter.fragments = fragments
+        elif args.fragment_dir is not None:
+            exporter.fragments = FragmentStore(args.fragment_dir)
         exporter.export_network()
 
         write_progress(5, steps)
-        if(args.gams_date_time_index is True):
-            exporter.use_gams_date_index=True
-
         exporter.write_time_index()
 
         if args.export_by_type is True:
@@ -365,6 +568,8 @@ def export_network(args, is_licensed):
 
         write_progress(6, steps)
         exporter.write_file()
+        if cache is not None:
+            cache.put(cache_key, args.output)
 
 
         write_progress(7, steps)
@@ -375,9 +580,21 @@ def check_args(args):
     except (TypeError, ValueError):
         raise HydraPluginError('No network is specified')
     try:
-        int(args.scenario_id)
+        scenario_ids = get_scenario_ids(args)
     except (TypeError, ValueError):
         raise HydraPluginError('No scenario is specified')
+    if len(scenario_ids) == 0:
+        raise HydraPluginError('No scenario is specified')
+    if len(scenario_ids) == 1:
+        # e.g. '3,' is exported as scenario 3
+        args.scenario_id = scenario_ids[0]
+
+    if args.output.startswith('|'):
+        if len(scenario_ids) > 1:
+            raise HydraPluginError('Several scenarios can not be exported '
+                                   'to a pipe.')
+        # The output is piped to a command, there is no directory to check.
+        return
 
     output = os.path.dirname(args.output)
     if output == '':
@@ -403,7 +620,11 @@ if __name__ == '__main__':
         link_export_flag = 'nn'
         if args.link_name is True:
             link_export_flag = 'l'
-        exporter=export_network(args, is_licensed)
+        scenario_ids = get_scenario_ids(args)
+        if len(scenario_ids) > 1:
+            export_scenarios(args, scenario_ids, is_licensed)
+        else:
+            exporter=export_network(args, is_licensed)
         message="Run successfully"
     except HydraPluginError as e:
         write_progress(steps, steps)
@@ -418,9 +639,13 @@ if __name__ == '__main__':
                 errors = [e.strerror]
         else:
             errors = [e.message]
+    try:
+        scenario_ids = get_scenario_ids(args)
+    except (TypeError, ValueError):
+        scenario_ids = [args.scenario_id]
     text = create_xml_response('GAMSExport',
                                args.network_id,
-                               [args.scenario_id],
+                               scenario_ids,
                                errors = errors,
                                message=message)
 
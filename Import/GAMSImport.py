@@ -35,6 +35,29 @@ Option                 Short  Parameter  Description
                                          used for the simulation.
 --gdx-file            -f     GDX_FILE   GDX file containing GAMS results
 
+**Optional arguments:**
+
+====================== ====== ========== ======================================
+Option                 Short  Parameter  Description
+====================== ====== ========== ======================================
+--workers              -w     WORKERS    Number of worker processes used to
+                                         build the result datasets. By
+                                         default they are built serially.
+--skip-includes        -si    PATTERN    Do not read included files matching
+                                         this pattern (e.g. the exported data
+                                         file), except for their header and
+                                         time index.
+--batch-size           -bs    BATCH_SIZE Save the results in batches of at
+                                         most this many datasets. By default
+                                         the scenario is saved at once.
+--batch-bytes          -bb    BYTES      Save the results in batches of at
+                                         most this many bytes.
+--attr-cache           -ac    FILE       File keeping the attributes of the
+                                         server between runs.
+--attr-cache-ttl       -at    SECONDS    Age after which the attributes in the
+                                         attribute cache are retrieved again
+                                         (default 3600).
+
 
 **Server-based arguments:**
 
@@ -70,6 +93,7 @@ python GAMSImport.py -t 4 -s 4 -f "c:\temp\Results.gdx" -m "c:\temp\Demo2.gms"
 import sys
 import os
 import logging
+import multiprocessing
 import argparse as ap
 
 pythondir   = os.path.dirname(os.path.realpath(__file__))
@@ -97,7 +121,7 @@ def import_results(is_licensed, args):
     gdximport.load_network(is_licensed)
 
     write_progress(3, steps)
-    gdximport.load_gams_file(args.gms_file)
+    gdximport.load_gams_file(args.gms_file, args.skip_includes)
 
     write_progress(4, steps)
     gdximport.parse_time_index()
@@ -105,9 +129,6 @@ def import_results(is_licensed, args):
     write_progress(5, steps)
     gdximport.open_gdx_file(args.gdx_file)
 
-    write_progress(6, steps)
-    gdximport.read_gdx_data()
-
     write_progress(7, steps)
     gdximport.parse_variables('variables')
     gdximport.parse_variables('positive variables')
@@ -116,10 +137,14 @@ def import_results(is_licensed, args):
     gdximport.parse_variables('parameters')
 
     write_progress(8, steps)
-    gdximport.assign_attr_data()
+    if args.workers is not None:
+        gdximport.assign_attr_data(workers=int(args.workers))
+    else:
+        gdximport.assign_attr_data()
 
     write_progress(9, steps)
-    gdximport.save()
+    gdximport.save(batch_size=args.batch_size,
+                   batch_bytes=args.batch_bytes)
 
 
 def commandline_parser():
@@ -143,6 +168,34 @@ def commandline_parser():
     parser.add_argument('-f', '--gdx-file',
                         help='GDX file containing GAMS results.')
 
+    parser.add_argument('-w', '--workers',
+                        help='''Number of worker processes used to build the
+                        result datasets. By default they are built in this
+                        process.''')
+
+    parser.add_argument('-si', '--skip-includes',
+                        help='''Do not read included files matching this pattern
+                        (e.g. the data file written by the exporter), except
+                        for their header and time index.''')
+
+    parser.add_argument('-bs', '--batch-size', type=int,
+                        help='''Save the results in batches of at most this many
+                        datasets. By default the whole scenario is saved at
+                        once.''')
+
+    parser.add_argument('-bb', '--batch-bytes', type=int,
+                        help='''Save the results in batches of at most this many
+                        bytes (of JSON encoded datasets).''')
+
+    parser.add_argument('-ac', '--attr-cache',
+                        help='''File keeping the attributes of the server, so
+                        that they are only retrieved again when the file is
+                        older than --attr-cache-ttl.''')
+
+    parser.add_argument('-at', '--attr-cache-ttl', default='3600',
+                        help='''Time in seconds after which the attributes in
+                        the attribute cache are retrieved again.''')
+
     parser.add_argument('-u', '--server-url',
                         help='''Specify the URL of the server to which this
                         plug-in connects.''')
@@ -166,6 +219,8 @@ def check_args(args):
 
 
 if __name__ == '__main__':
+    # Needed by the worker processes of the frozen executable
+    multiprocessing.freeze_support()
     message=""
     try:
         is_licensed = check_lic()
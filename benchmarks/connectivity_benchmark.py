@@ -0,0 +1,80 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+Compare the dense and the sparse export of the connectivity matrix.
+
+The network is a chain of N nodes with two extra links per node, so the
+number of links E grows linearly with N. The dense table grows with N^2, the
+sparse parameter with N + E. Doubling N should roughly quadruple the time and
+size of the dense export, while the sparse export only doubles.
+
+Usage:
+    python connectivity_benchmark.py [N N ...]
+"""
+
+import os
+import sys
+import time
+
+pythondir = os.path.dirname(os.path.realpath(__file__))
+gamslibpath = os.path.join(pythondir, '..', 'lib')
+api_path = os.path.realpath(gamslibpath)
+if api_path not in sys.path:
+    sys.path.insert(0, api_path)
+
+from Exporter import GAMSExporter
+
+
+class Resource(object):
+    def __init__(self, name, from_node=None, to_node=None):
+        self.name = name
+        self.from_node = from_node
+        self.to_node = to_node
+
+
+class Network(object):
+    def __init__(self, n_nodes):
+        self.nodes = [Resource('node_%s' % i) for i in range(n_nodes)]
+        self.links = []
+        for i in range(n_nodes):
+            for step in (1, 2, 7):
+                j = (i + step) % n_nodes
+                self.links.append(Resource('link_%s_%s' % (i, j),
+                                           self.nodes[i].name,
+                                           self.nodes[j].name))
+
+
+def make_exporter(n_nodes, sparse):
+    exporter = GAMSExporter.__new__(GAMSExporter)
+    exporter.network = Network(n_nodes)
+    exporter.sparse_connect = sparse
+    exporter.get_longest_node_link_name()
+    return exporter
+
+
+def run(n_nodes, sparse):
+    exporter = make_exporter(n_nodes, sparse)
+    start = time.time()
+    output = exporter.create_connectivity_matrix()
+    elapsed = time.time() - start
+    size = sum(len(part) for part in output)
+    return elapsed, size, len(exporter.network.links)
+
+
+if __name__ == '__main__':
+    sizes = [int(n) for n in sys.argv[1:]] or [250, 500, 1000, 2000]
+
+    print "%8s %8s %12s %14s %12s %14s" % ('N', 'E', 'dense [s]', 'dense [bytes]',
+                                          'sparse [s]', 'sparse [bytes]')
+    previous = None
+    for n in sizes:
+        dense_time, dense_size, n_links = run(n, False)
+        sparse_time, sparse_size, n_links = run(n, True)
+        print "%8s %8s %12.4f %14s %12.4f %14s" % (n, n_links, dense_time, dense_size,
+                                                  sparse_time, sparse_size)
+        if previous is not None:
+            factor = float(n) / previous[0]
+            print "%8s growth for %.1fx nodes: dense %.1fx, sparse %.1fx" % \
+                ('', factor, float(dense_size) / previous[1],
+                 float(sparse_size) / previous[2])
+        previous = (n, dense_size, sparse_size)
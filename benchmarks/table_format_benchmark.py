@@ -0,0 +1,82 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+Compare the per-cell formatting of time series tables used by the exporter
+with the block formatting of TableFormat.format_table.
+
+Usage:
+    python table_format_benchmark.py [n_series n_steps]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+pythondir = os.path.dirname(os.path.realpath(__file__))
+gamslibpath = os.path.join(pythondir, '..', 'lib')
+api_path = os.path.realpath(gamslibpath)
+if api_path not in sys.path:
+    sys.path.insert(0, api_path)
+
+from TableFormat import format_table
+
+
+def per_cell_by_attribute(labels, values, width):
+    """The cell loop of export_timeseries_using_attributes"""
+    ff = '{0:<' + str(width) + '}'
+    output = []
+    for label, row in zip(labels, values.tolist()):
+        output.append('\n' + ff.format(label))
+        for data in row:
+            output.append(ff.format(str(float(data))))
+    return ''.join(output)
+
+
+def per_cell_by_type(labels, values, width):
+    """The cell loop of export_timeseries_using_type"""
+    output = []
+    for label, row in zip(labels, values.tolist()):
+        output.append('{0:<7}'.format(label))
+        for data in row:
+            try:
+                data_str = ' %14f' % float(data)
+            except:
+                data_str = str(data)
+            output.append(data_str.rjust(width))
+        output.append('\n')
+    return ''.join(output)
+
+
+def timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        n_series, n_steps = int(sys.argv[1]), int(sys.argv[2])
+    else:
+        n_series, n_steps = 2000, 360
+
+    values = np.random.RandomState(0).rand(n_series, n_steps) * 1000
+    labels = ['node_%s' % i for i in range(n_series)]
+    width = 20
+
+    print "%s series x %s time steps (%s cells)" % (n_series, n_steps, n_series * n_steps)
+
+    old_time, old = timed(per_cell_by_attribute, labels, values, width)
+    new_time, new = timed(format_table, labels, values, width,
+                          line_start='\n', line_end='', label_format='%-20s')
+    print "by attribute: per cell %.3f s, block %.3f s (%.1fx), identical output: %s" % \
+        (old_time, new_time, old_time / new_time, old == new)
+
+    # In the by type table rows are time steps and columns are series
+    steps = [str(t) for t in range(n_steps)]
+    old_time, old = timed(per_cell_by_type, steps, values.T, width)
+    new_time, new = timed(format_table, steps, values.T, width, align='right',
+                          precision=6, label_format='%-7s')
+    print "by type:      per cell %.3f s, block %.3f s (%.1fx), identical output: %s" % \
+        (old_time, new_time, old_time / new_time, old == new)
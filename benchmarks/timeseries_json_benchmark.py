@@ -0,0 +1,74 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+Compare the previous time series encoding of the importer, where every value
+was JSON encoded on its own and the series encoded again, with the compact
+encoding of GAMSImporter.create_timeseries.
+
+Sizes and times are given per million records.
+
+Usage:
+    python timeseries_json_benchmark.py [n_series n_steps]
+"""
+
+import os
+import sys
+import time
+import json
+
+import numpy as np
+
+pythondir = os.path.dirname(os.path.realpath(__file__))
+gamslibpath = os.path.join(pythondir, '..', 'lib')
+api_path = os.path.realpath(gamslibpath)
+if api_path not in sys.path:
+    sys.path.insert(0, api_path)
+
+from Importer import GAMSImporter
+
+
+def double_encoded(time_axis, index, data):
+    """The previous create_timeseries"""
+    timeseries = {'0': {}}
+    for i, idx in enumerate(index):
+         if idx.find(".") is -1:
+             timeseries['0'][time_axis[int(idx)]] = json.dumps(data[i])
+         else:
+             timeseries['0'][time_axis[idx]] = json.dumps(data[i])
+
+    return json.dumps(timeseries)
+
+
+def encode_all(func, series):
+    start = time.time()
+    n_bytes = 0
+    for index, data in series:
+        n_bytes += len(func(index, data))
+    return time.time() - start, n_bytes
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        n_series, n_steps = int(sys.argv[1]), int(sys.argv[2])
+    else:
+        n_series, n_steps = 2000, 500
+
+    importer = GAMSImporter.__new__(GAMSImporter)
+    importer.time_axis = dict((t, '2000-01-01 00:00:00+%05d' % t)
+                              for t in range(n_steps))
+    index = [str(t) for t in range(n_steps)]
+    values = np.random.RandomState(0).rand(n_series, n_steps) * 1000
+    series = [(index, row) for row in values.tolist()]
+
+    n_records = n_series * n_steps
+    scale = 1e6 / n_records
+    print "%s series x %s time steps (%s records)" % (n_series, n_steps, n_records)
+
+    old_time, old_bytes = encode_all(
+        lambda i, d: double_encoded(importer.time_axis, i, d), series)
+    new_time, new_bytes = encode_all(importer.create_timeseries, series)
+    print "double encoded: %.2f s, %.1f MB per million records" % \
+        (old_time * scale, old_bytes * scale / 1e6)
+    print "compact:        %.2f s, %.1f MB per million records (%.1fx faster, %.0f%% of the size)" % \
+        (new_time * scale, new_bytes * scale / 1e6, old_time / new_time,
+         100. * new_bytes / old_bytes)
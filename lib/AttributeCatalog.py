@@ -0,0 +1,166 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+The attributes defined on the server, shared by all exporters and importers
+of a process.
+
+``get_all_attributes`` returns every attribute of the server, which can be a
+large request. The catalog retrieves them once per process and server and
+indexes them by id and by name. It can also be kept in a file, so that
+following runs only retrieve the attributes again when the file is older
+than its time to live.
+
+When an attribute id is not in the catalog, e.g. because it was created
+after the catalog was loaded, the attributes are retrieved again.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+_catalogs = dict()
+_catalogs_lock = threading.Lock()
+
+
+class CatalogAttribute(dict):
+    """An attribute read from the cache file, with attribute access like
+    the objects returned by the server."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class AttributeCatalog(object):
+
+    def __init__(self, connection, cache_file=None, ttl=3600):
+        self.connection = connection
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.attributes = []
+        self.by_id = dict()
+        self.by_name = dict()
+        self.missing = set()
+        self.lock = threading.RLock()
+        self.loaded = False
+
+    def __iter__(self):
+        self.load()
+        return iter(self.attributes)
+
+    def __len__(self):
+        self.load()
+        return len(self.attributes)
+
+    def load(self):
+        """
+        Load the attributes from the cache file if it is recent enough,
+        otherwise from the server.
+        """
+        with self.lock:
+            if self.loaded:
+                return
+            if self.cache_file is not None and \
+                    os.path.exists(self.cache_file) and \
+                    time.time() - os.path.getmtime(self.cache_file) < self.ttl:
+                try:
+                    with open(self.cache_file) as f:
+                        attributes = [CatalogAttribute(attr)
+                                      for attr in json.load(f)]
+                    self.set_attributes(attributes)
+                    log.info("%s attributes read from %s",
+                             len(attributes), self.cache_file)
+                    return
+                except ValueError:
+                    log.warning("Attribute cache %s is invalid, ignoring it.",
+                                self.cache_file)
+            self.refresh()
+
+    def refresh(self):
+        """
+        Retrieve the attributes from the server and update the cache file.
+        """
+        with self.lock:
+            attributes = self.connection.call('get_all_attributes', {})
+            log.info("%s attributes retrieved", len(attributes))
+            self.set_attributes(attributes)
+            self.missing = set()
+            if self.cache_file is not None:
+                self.write_cache_file()
+
+    def write_cache_file(self):
+        # Written to a temporary file first, as other processes may read it
+        tmp_file = '%s.%s.tmp' % (self.cache_file, os.getpid())
+        with open(tmp_file, 'w') as f:
+            json.dump([dict(attr) for attr in self.attributes], f,
+                      default=str)
+        try:
+            os.rename(tmp_file, self.cache_file)
+        except OSError:
+            # Windows doesn't replace an existing file
+            os.remove(self.cache_file)
+            os.rename(tmp_file, self.cache_file)
+
+    def set_attributes(self, attributes):
+        self.attributes = list(attributes)
+        self.by_id = dict((attr.id, attr) for attr in self.attributes)
+        self.by_name = dict()
+        for attr in self.attributes:
+            self.by_name.setdefault(attr.name.lower(), []).append(attr)
+        self.loaded = True
+
+    def get(self, attr_id):
+        """
+        Return the attribute with id ``attr_id``. If it isn't in the
+        catalog, the attributes are retrieved again; a KeyError is raised if
+        the attribute still doesn't exist.
+        """
+        self.load()
+        attr = self.by_id.get(attr_id)
+        if attr is None:
+            with self.lock:
+                if attr_id not in self.by_id and attr_id not in self.missing:
+                    log.info("Attribute %s not found, retrieving attributes "
+                             "again.", attr_id)
+                    self.refresh()
+                attr = self.by_id.get(attr_id)
+                if attr is None:
+                    self.missing.add(attr_id)
+                    raise KeyError(attr_id)
+        return attr
+
+    def get_name(self, attr_id):
+        return self.get(attr_id).name
+
+    def get_by_name(self, name):
+        """
+        Return all attributes called ``name`` (not case sensitive), which
+        may be several with different dimensions.
+        """
+        self.load()
+        return self.by_name.get(name.lower(), [])
+
+
+def get_attribute_catalog(connection, cache_file=None, ttl=3600):
+    """
+    Return the attribute catalog of the server of ``connection``, which is
+    created the first time it is used in a process.
+    """
+    key = (getattr(connection, 'url', None), cache_file)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            catalog = AttributeCatalog(connection, cache_file=cache_file,
+                                       ttl=ttl)
+            _catalogs[key] = catalog
+        else:
+            # Use the latest connection, in case the session of the first
+            # one has expired
+            catalog.connection = connection
+    return catalog
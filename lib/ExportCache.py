@@ -0,0 +1,189 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+On-disk cache of exported files.
+
+An export is keyed on a hash of everything it depends on: the network and
+scenario as returned by the server, the template, the time axis and the
+export options. If the same network is exported again without any changes,
+the cached file is copied to the output instead of being generated.
+
+Every entry is stored as ``<key><ext>``, together with its index file (see
+``HydraGAMSlib.get_index_file_name``) if there is one. When the cache grows
+larger than its maximum size, the least recently used entries are removed.
+
+A ``FragmentStore`` keeps the sections of a text export instead, so that only
+the sections whose data changed are generated again.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+
+from HydraGAMSlib import get_index_file_name
+
+log = logging.getLogger(__name__)
+
+
+def get_cache_key(*parts):
+    """
+    Return a hash of ``parts``, which must be JSON serialisable (dates and
+    other values are converted to strings).
+    """
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(text).hexdigest()
+
+
+class ExportCache(object):
+
+    def __init__(self, directory, max_size=1024 * 1024 * 1024):
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def get_entry(self, key, filename):
+        return os.path.join(self.directory,
+                            key + os.path.splitext(filename)[1])
+
+    def get(self, key, filename):
+        """
+        Copy the cached export ``key`` to ``filename``. Returns False if
+        there is no such entry.
+        """
+        entry = self.get_entry(key, filename)
+        if not os.path.exists(entry):
+            return False
+        shutil.copyfile(entry, filename)
+        if os.path.exists(get_index_file_name(entry)):
+            shutil.copyfile(get_index_file_name(entry),
+                            get_index_file_name(filename))
+        # Mark the entry as recently used
+        now = time.time()
+        os.utime(entry, (now, now))
+        log.info("Export %s copied from cache %s", filename, entry)
+        return True
+
+    def put(self, key, filename):
+        """
+        Add the exported file ``filename`` to the cache as ``key`` and
+        remove the least recently used entries if the cache is too large.
+        """
+        entry = self.get_entry(key, filename)
+        shutil.copyfile(filename, entry + '.tmp')
+        os.rename(entry + '.tmp', entry)
+        if os.path.exists(get_index_file_name(filename)):
+            shutil.copyfile(get_index_file_name(filename),
+                            get_index_file_name(entry))
+        log.info("Export %s added to cache %s", filename, entry)
+        self.evict(keep=entry)
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache is no larger
+        than ``max_size``. The entry ``keep`` is never removed.
+        """
+        entries = []
+        size = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.tmp') or name.endswith('.json') or \
+                    not os.path.isfile(path):
+                continue
+            files = [path]
+            if os.path.exists(get_index_file_name(path)):
+                files.append(get_index_file_name(path))
+            entry_size = sum(os.path.getsize(f) for f in files)
+            entries.append((os.path.getmtime(path), path, files, entry_size))
+            size += entry_size
+
+        for mtime, path, files, entry_size in sorted(entries):
+            if size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            for f in files:
+                os.remove(f)
+            size -= entry_size
+            log.info("Removed %s from the export cache", path)
+
+
+class FragmentStore(object):
+    """
+    Sections of a text export, stored on disk by a fingerprint of their
+    inputs (see ``GAMSExporter.write_section``). When a modified scenario is
+    exported again, only sections whose inputs changed are generated, all
+    others are read from the store.
+
+    Fragments which are not used by an export are removed by ``clean``, so
+    a store only holds the sections of the last export written with it.
+
+    Without a directory, fragments are only kept in memory, e.g. to share
+    the sections which are the same in several scenarios of one network.
+    If ``sections`` is given, only the sections with these names are
+    stored, all others are generated every time.
+    """
+
+    def __init__(self, directory=None, sections=None):
+        self.directory = None
+        self.sections = sections
+        self.memory = dict()
+        self.used = set()
+        self.reused = 0
+        self.generated = 0
+        if directory is not None:
+            self.directory = os.path.abspath(directory)
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+    def stores(self, name):
+        """Return True if the section ``name`` is kept in the store."""
+        return self.sections is None or name in self.sections
+
+    def get_path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint + '.frag')
+
+    def get(self, fingerprint):
+        """
+        Return the text of a fragment, or None if there is no fragment with
+        this fingerprint.
+        """
+        if self.directory is None:
+            text = self.memory.get(fingerprint)
+            if text is None:
+                return None
+        else:
+            path = self.get_path(fingerprint)
+            if not os.path.exists(path):
+                return None
+            with open(path) as f:
+                text = f.read()
+        self.used.add(fingerprint)
+        self.reused += 1
+        return text
+
+    def put(self, fingerprint, text):
+        if self.directory is None:
+            self.memory[fingerprint] = text
+        else:
+            path = self.get_path(fingerprint)
+            with open(path + '.tmp', 'w') as f:
+                f.write(text)
+            os.rename(path + '.tmp', path)
+        self.used.add(fingerprint)
+        self.generated += 1
+
+    def clean(self):
+        """
+        Remove all fragments which were not used since the store was opened.
+        """
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                fingerprint, ext = os.path.splitext(name)
+                if ext in ('.frag', '.tmp') and fingerprint not in self.used:
+                    os.remove(os.path.join(self.directory, name))
+        log.info("%s sections generated, %s sections reused",
+                 self.generated, self.reused)
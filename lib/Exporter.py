@@ -11,12 +11,25 @@ from hydra_base.util.hydra_dateutil import reindex_timeseries
 
 from HydraGAMSlib import GAMSnetwork
 from HydraGAMSlib import convert_date_to_timeindex
+from HydraGAMSlib import translate_attr_name
+from HydraGAMSlib import get_index_file_name
+from Sinks import create_sink
+from ExportCache import get_cache_key
+from AttributeCatalog import get_attribute_catalog
+from SymbolWriter import GDXSymbolWriter, DatabaseSymbolWriter
+from TimeSeries import TimeSeriesMatrix
+from TableFormat import format_table
 
 log = logging.getLogger(__name__)
 
 class GAMSExporter(JSONPlugin):
 
-    def __init__(self, args):
+    # The sections which only depend on the network, not on the data of a
+    # scenario
+    topology_sections = ('nodes', 'node groups', 'links', 'link groups',
+                         'connectivity', 'coordinates', 'time index')
+
+    def __init__(self, args, sink=None, connection=None, attrs=None):
 
         if args.template_id is not None:
             self.template_id = int(args.template_id)
@@ -26,11 +39,18 @@ class GAMSExporter(JSONPlugin):
         self.scenario_id = int(args.scenario_id)
         self.template_id = int(args.template_id) if args.template_id is not None else None
         self.filename = args.output
+        self.sink = sink if sink is not None else create_sink(self.filename)
         self.time_index = []
         self.time_axis =None
+        self.timeseries = None
+        self.scenario = None
+        self.fragments = None
 
 
-        self.connect(args)
+        if connection is not None:
+            self.connection = connection
+        else:
+            self.connect(args)
         if args.time_axis is not None:
             args.time_axis = ' '.join(args.time_axis).split(' ')
 
@@ -44,18 +64,41 @@ class GAMSExporter(JSONPlugin):
         else:
             self.links_as_name = False
 
+        self.sparse_connect = args.sparse_connect is True
+        self.precision = int(args.precision) if args.precision is not None else None
+
 
 
-        self.attrs = self.connection.call('get_all_attributes', {})
-        log.info("%s attributes retrieved", len(self.attrs))
+        if attrs is not None:
+            self.attrs = attrs
+        else:
+            self.attrs = get_attribute_catalog(self.connection,
+                                               cache_file=args.attr_cache,
+                                               ttl=int(args.attr_cache_ttl))
 
-    def get_network(self, is_licensed):
+    def fetch_network(self, scenario_ids=None):
+        """
+            Retrieve the network with the data of ``scenario_ids`` (by
+            default only the scenario of this exporter) in one call.
+        """
+        if scenario_ids is None:
+            scenario_ids = [self.scenario_id]
         net = self.connection.call('get_network', {'network_id':self.network_id,
                                                    'include_data': 'Y',
                                                    'template_id':self.template_id,
-                                                   'scenario_ids':[self.scenario_id]})
+                                                   'scenario_ids':scenario_ids})
+        log.info("Network retrieved with %s scenarios", len(scenario_ids))
+        return net
+
+    def get_network(self, is_licensed, net=None):
+        """
+            Load the network and the data of the scenario to export. ``net``
+            is a network already retrieved with fetch_network, possibly with
+            the data of several scenarios.
+        """
+        if net is None:
+            net = self.fetch_network()
         self.hydranetwork=net
-        log.info("Network retrieved")
 
         if net.scenarios is not None:
             for s in net.scenarios:
@@ -65,7 +108,20 @@ class GAMSExporter(JSONPlugin):
 
         self.network = GAMSnetwork()
         log.info("Loading net into gams network.")
-        self.network.load(net, self.attrs)
+        if net.scenarios is not None and len(net.scenarios) > 1:
+            # The network is loaded with the data of its first scenario
+            scenarios = net.scenarios
+            net.scenarios = [s for s in scenarios if s.id == self.scenario_id]
+            if len(net.scenarios) == 0:
+                net.scenarios = scenarios
+                raise HydraPluginError("Scenario %s not found in network %s." %
+                                       (self.scenario_id, net.id))
+            try:
+                self.network.load(net, self.attrs)
+            finally:
+                net.scenarios = scenarios
+        else:
+            self.network.load(net, self.attrs)
         if(is_licensed is False):
             if len(self.network.nodes)>20:
                 raise HydraPluginError("The licence is limited demo (maximum limits are 20 nodes and 20 times steps).  Please contact software vendor (hydraplatform1@gmail.com) to get a full licence")
@@ -74,7 +130,45 @@ class GAMSExporter(JSONPlugin):
         log.info("Gams network loaded")
         self.network.gams_names_for_links(use_link_name=self.links_as_name)
         log.info("Names for links retrieved")
-        self.output = """* Data exported from Hydra using GAMSplugin.
+
+    def get_cache_key(self, **options):
+        """
+            Return a hash of the network and exported scenario as retrieved
+            from the server, the attributes, template, time axis and export options.
+            Exports with the same key produce the same output. ``options``
+            are options which are not set on the exporter, e.g. whether data
+            is exported by type.
+        """
+        # Only the exported scenario, as the network may have been retrieved
+        # with several scenarios
+        network = dict((key, value) for key, value in self.hydranetwork.items()
+                       if key != 'scenarios')
+        return get_cache_key(network, self.scenario, self.get_used_attributes(),
+                             self.template_id, self.time_axis,
+                             dict(links_as_name=self.links_as_name,
+                                  use_gams_date_index=self.use_gams_date_index,
+                                  sparse_connect=self.sparse_connect,
+                                  precision=self.precision),
+                             options)
+
+    def get_used_attributes(self):
+        """
+            Return (id, name) of the attributes the network uses, sorted by
+            id. Only these affect the export, not the other attributes of
+            the server.
+        """
+        net = self.hydranetwork
+        attr_ids = set()
+        for resource in [net] + list(net.nodes or []) + list(net.links or []) + \
+                list(net.resourcegroups or []):
+            for res_attr in resource.attributes or []:
+                attr_ids.add(res_attr.attr_id)
+        attributes = dict((attr.id, attr.name) for attr in self.attrs
+                          if attr.id in attr_ids)
+        return sorted(attributes.items())
+
+    def write_header(self):
+        self.write("""* Data exported from Hydra using GAMSplugin.
 * (c) Copyright 2015, University of Manchester
 *
 * %s: %s
@@ -83,7 +177,81 @@ class GAMSExporter(JSONPlugin):
 *******************************************************************************
 
 """ % (self.network.name, self.network.description,
-            self.network.ID, self.network.scenario_id)
+            self.network.ID, self.network.scenario_id))
+
+    def write_section(self, name, inputs, export, *args, **kwargs):
+        """
+        Write the section returned by ``export(*args, **kwargs)``. If a
+        FragmentStore is set in ``self.fragments`` which stores the section,
+        it is only generated if the store has no fragment with the same name,
+        inputs (anything JSON serialisable the output depends on) and export
+        options; otherwise the stored fragment is written.
+        """
+        if self.fragments is None or not self.fragments.stores(name):
+            self.write(export(*args, **kwargs))
+            return
+
+        fingerprint = get_cache_key(name, inputs, self.get_section_options())
+        text = self.fragments.get(fingerprint)
+        if text is None:
+            data = export(*args, **kwargs)
+            if isinstance(data, basestring):
+                text = data
+            else:
+                text = ''.join(data)
+            self.fragments.put(fingerprint, text)
+        self.write(text)
+
+    def get_section_options(self):
+        """
+        Return the options which change the output of any section.
+        """
+        return dict(template_id=self.template_id,
+                    links_as_name=self.links_as_name,
+                    use_gams_date_index=self.use_gams_date_index,
+                    sparse_connect=self.sparse_connect,
+                    precision=self.precision,
+                    name_len=getattr(self, 'name_len', None),
+                    array_len=getattr(self, 'array_len', None))
+
+    def get_resource_inputs(self, resources, datatypes=()):
+        """
+        Return the inputs of a section for fingerprinting: the names, types
+        and groups of ``resources`` and their attributes holding one of
+        ``datatypes``.
+        """
+        inputs = []
+        for resource in resources:
+            attributes = []
+            for datatype in datatypes:
+                for attr in self.network.get_resource_attributes(resource, datatype):
+                    attributes.append((translate_attr_name(attr.name),
+                                       attr.dataset_type, attr.is_var,
+                                       attr.dataset_id, attr.value))
+            if resource is self.network:
+                # The groups of the network are the group objects
+                groups = None
+            else:
+                groups = resource.groups
+            inputs.append((resource.name,
+                           getattr(resource, 'from_node', None),
+                           getattr(resource, 'to_node', None),
+                           getattr(resource, 'gams_name', None),
+                           resource.template, groups, attributes))
+        return inputs
+
+    def get_group_inputs(self):
+        return [(group.ID, group.name) for group in self.network.groups]
+
+    def write(self, data):
+        """
+        Send a section of the output to the sink. ``data`` is either a string
+        or a list of strings.
+        """
+        if isinstance(data, basestring):
+            self.sink.write(data)
+        else:
+            self.sink.writelines(data)
 
     def check_links_between_nodes(self):
         for link in self.network.links:
@@ -95,22 +263,32 @@ class GAMSExporter(JSONPlugin):
                     break
 
     def export_network(self):
+        self.write_header()
         if self.links_as_name is False:
             self.check_links_between_nodes()
         self.get_longest_node_link_name();
-        self.output += '* Network definition\n\n'
+        self.write('* Network definition\n\n')
+        nodes = self.get_resource_inputs(self.network.nodes)
+        links = self.get_resource_inputs(self.network.links)
+        groups = self.get_group_inputs()
         log.info("Exporting nodes")
-        self.export_nodes()
+        self.write_section('nodes', nodes, self.export_nodes)
         log.info("Exporting node groups")
-        self.export_node_groups()
+        self.write_section('node groups', [nodes, groups],
+                           self.export_node_groups)
         log.info("Exporting links")
-        self.export_links()
+        self.write_section('links', links, self.export_links)
         log.info("Exporting link groups")
-        self.export_link_groups()
+        self.write_section('link groups', [links, groups],
+                           self.export_link_groups)
         log.info("Creating connectivity matrix")
-        self.create_connectivity_matrix()
+        self.write_section('connectivity', [nodes, links],
+                           self.create_connectivity_matrix)
         log.info("Writing nodes coordinates")
-        self.export_resources_coordinates()
+        self.write_section('coordinates',
+                           [(node.name, node.X, node.Y)
+                            for node in self.network.nodes],
+                           self.export_resources_coordinates)
         log.info("Matrix created")
 
     def get_longest_node_link_name(self):
@@ -123,28 +301,30 @@ class GAMSExporter(JSONPlugin):
         self.array_len=str(node_name_len*2+15)
 
     def export_nodes(self):
-        self.output += 'SETS\n\n'
+        output = ['SETS\n\n']
         # Write all nodes ...
-        self.output += 'i vector of all nodes /\n'
+        output.append('i vector of all nodes /\n')
         for node in self.network.nodes:
-            self.output += node.name + '\n'
-        self.output += '    /\n\n'
+            output.append(node.name + '\n')
+        output.append('    /\n\n')
         # ... and create an alias for the index i called j:
-        self.output += 'Alias(i,j)\n\n'
+        output.append('Alias(i,j)\n\n')
         # After an 'Alias; command another 'SETS' command is needed
-        self.output += '* Node types\n\n'
-        self.output += 'SETS\n\n'
+        output.append('* Node types\n\n')
+        output.append('SETS\n\n')
         # Group nodes by type
         for object_type in self.network.get_node_types(template_id=self.template_id):
-            self.output += object_type + '(i) /\n'
+            output.append(object_type + '(i) /\n')
             for node in self.network.get_node(node_type=object_type):
-                self.output += node.name + '\n'
-            self.output += '/\n\n'
+                output.append(node.name + '\n')
+            output.append('/\n\n')
+        return output
 
     def export_node_groups(self):
         "Export node groups if there are any."
         node_groups = []
         group_strings = []
+        output = []
         for group in self.network.groups:
             group_nodes = self.network.get_node(group=group.ID)
             if len(group_nodes) > 0:
@@ -157,50 +337,52 @@ class GAMSExporter(JSONPlugin):
                 group_strings.append(gstring)
 
         if len(node_groups) > 0:
-            self.output += '* Node groups\n\n'
-            self.output += 'node_groups vector of all node groups /\n'
+            output.append('* Node groups\n\n')
+            output.append('node_groups vector of all node groups /\n')
             for group in node_groups:
-                self.output += group.name + '\n'
-            self.output += '/\n\n'
-            for gstring in group_strings:
-                self.output += gstring
+                output.append(group.name + '\n')
+            output.append('/\n\n')
+            output.extend(group_strings)
+        return output
 
     def export_links(self):
-        self.output += 'SETS\n\n'
+        output = ['SETS\n\n']
         # Write all links ...
         if self.links_as_name:
-            self.output += 'link_name /\n'
+            output.append('link_name /\n')
             for link in self.network.links:
-                self.output +=link.name+'\n'
-            self.output += '/\n\n'
-            self.output += 'links (link_name, i, j) vector of all links /\n'
+                output.append(link.name+'\n')
+            output.append('/\n\n')
+            output.append('links (link_name, i, j) vector of all links /\n')
         else:
-            self.output += 'links(i,j) vector of all links /\n'
+            output.append('links(i,j) vector of all links /\n')
         for link in self.network.links:
             if self.links_as_name:
-                self.output += link.name +" . "+link.from_node+" . "+link.to_node  +'\n'
+                output.append(link.name +" . "+link.from_node+" . "+link.to_node  +'\n')
             else:
-                self.output += link.gams_name + '\n'
-        self.output += '    /\n\n'
+                output.append(link.gams_name + '\n')
+        output.append('    /\n\n')
         # Group links by type
-        self.output += '* Link types\n\n'
+        output.append('* Link types\n\n')
         for object_type in self.network.get_link_types(template_id=self.template_id):
-            self.output += object_type
+            output.append(object_type)
             if self.links_as_name:
-                self.output += ' /\n'
+                output.append(' /\n')
             else:
-                self.output += '(i,j) /\n'
+                output.append('(i,j) /\n')
             for link in self.network.get_link(link_type=object_type):
                 if self.links_as_name:
-                    self.output += link.name + '\n'
+                    output.append(link.name + '\n')
                 else:
-                    self.output += link.gams_name + '\n'
-            self.output += '/\n\n'
+                    output.append(link.gams_name + '\n')
+            output.append('/\n\n')
+        return output
 
     def export_link_groups(self):
         "Export link groups if there are any."
         link_groups = []
         link_strings = []
+        output = []
         for group in self.network.groups:
             group_links = self.network.get_link(group=group.ID)
             if len(group_links) > 0:
@@ -213,84 +395,133 @@ class GAMSExporter(JSONPlugin):
                 link_strings.append(lstring)
 
         if len(link_groups) > 0:
-            self.output += '* Link groups\n\n'
-            self.output += 'link_groups vector of all link groups /\n'
+            output.append('* Link groups\n\n')
+            output.append('link_groups vector of all link groups /\n')
             for group in link_groups:
-                self.output += group.name + '\n'
-            self.output += '/\n\n'
-            for lstring in link_strings:
-                self.output += lstring
+                output.append(group.name + '\n')
+            output.append('/\n\n')
+            output.extend(link_strings)
+        return output
 
     def create_connectivity_matrix(self):
+        if self.sparse_connect is True:
+            return self.create_sparse_connectivity()
+
         ff='{0:<'+self.name_len+'}'
 
-        self.output += '* Connectivity matrix.\n'
-        self.output += 'Table Connect(i,j)\n'
-        self.output +=ff.format('')
+        output = ['* Connectivity matrix.\n']
+        output.append('Table Connect(i,j)\n')
+        output.append(ff.format(''))
         node_names = [node.name for node in self.network.nodes]
+        node_index = dict((name, i) for i, name in enumerate(node_names))
         for name in node_names:
-            self.output += ff.format( name)
-        self.output += '\n'
+            output.append(ff.format( name))
+        output.append('\n')
         conn = [[0 for node in node_names] for node in node_names]
         for link in self.network.links:
-            conn[node_names.index(link.from_node)]\
-                [node_names.index(link.to_node)] = 1
+            conn[node_index[link.from_node]][node_index[link.to_node]] = 1
 
         connlen = len(conn)
-        rows = []
         for i in range(connlen):
-            rows.append(ff.format( node_names[i]))
+            output.append(ff.format( node_names[i]))
             txt = []
             for j in range(connlen):
                 txt.append(ff.format( conn[i][j]))
             x = "".join(txt)
-            rows.append("%s%s"%(x, '\n\n'))
+            output.append("%s%s"%(x, '\n\n'))
+
+        return output
+
+    def create_sparse_connectivity(self):
+        """
+        Write the connectivity matrix as a parameter which only lists the
+        existing connections. GAMS sets all other entries of Connect(i,j) to
+        zero, so the output grows with the number of nodes and links rather
+        than with the square of the number of nodes.
+        """
+        ff='{0:<'+self.name_len+'}'
+
+        node_index = dict((node.name, i) for i, node in enumerate(self.network.nodes))
+        connections = set()
+        for link in self.network.links:
+            connections.add((node_index[link.from_node], node_index[link.to_node]))
+
+        node_names = [node.name for node in self.network.nodes]
+        output = ['* Connectivity matrix.\n']
+        output.append('Parameter Connect(i,j) /\n')
+        for i, j in sorted(connections):
+            output.append(ff.format(node_names[i] + ' . ' + node_names[j]))
+            output.append('1\n')
+        output.append('/;\n\n')
 
-        self.output = self.output + "".join(rows)
+        return output
 
     def export_resources_coordinates(self):
         ff='{0:<'+self.name_len+'}'
         threeplaces = Decimal('0.001')
-        self.output += ('\nParameter x_coord (i)/\n')
+        output = ['\nParameter x_coord (i)/\n']
 
         for node in self.network.nodes:
-            self.output += (ff.format(node.name))
+            output.append(ff.format(node.name))
             x_coord = Decimal(node.X).quantize(threeplaces)
-            self.output += (ff.format(x_coord))
-            self.output += ('\n')
+            output.append(ff.format(x_coord))
+            output.append('\n')
 
-        self.output += ('/;\n\nParameter y_coord (i)/\n')
+        output.append('/;\n\nParameter y_coord (i)/\n')
         for node in self.network.nodes:
-            self.output += (ff.format(node.name))
+            output.append(ff.format(node.name))
             y_coord = Decimal(node.Y).quantize(threeplaces)
-            self.output += (ff.format(y_coord))
-            self.output += ('\n')
-        self.output += ('/;\n\n');
+            output.append(ff.format(y_coord))
+            output.append('\n')
+        output.append('/;\n\n')
+        return output
 
     def export_data_using_types(self):
         log.info("Exporting data")
         # Export node data for each node type
-        data = ['* Node data\n\n']
+        self.load_timeseries()
+        self.write('* Node data\n\n')
         self.time_table={}
         for node_type in \
                 self.network.get_node_types(template_id=self.template_id):
-            data.append('* Data for node type %s\n\n' % node_type)
+            self.write('* Data for node type %s\n\n' % node_type)
             nodes = self.network.get_node(node_type=node_type)
-            data.extend(self.export_parameters_using_type(nodes, node_type, 'scalar'))
-            data.extend(self.export_parameters_using_type(nodes, node_type, 'descriptor'))
-            data.extend(self.export_timeseries_using_type(nodes, node_type))
-            data.extend(self.export_arrays(nodes))
+            self.write_section('node type %s scalar' % node_type,
+                               self.get_resource_inputs(nodes, ('scalar',)),
+                               self.export_parameters_using_type,
+                               nodes, node_type, 'scalar')
+            self.write_section('node type %s descriptor' % node_type,
+                               self.get_resource_inputs(nodes, ('descriptor',)),
+                               self.export_parameters_using_type,
+                               nodes, node_type, 'descriptor')
+            self.write_section('node type %s timeseries' % node_type,
+                               [self.time_index,
+                                self.get_resource_inputs(nodes, ('timeseries',))],
+                               self.export_timeseries_using_type,
+                               nodes, node_type)
+            self.write_section('node type %s array' % node_type,
+                               self.get_resource_inputs(nodes, ('array',)),
+                               self.export_arrays, nodes)
 
         # Export link data for each node type
-        data.append('* Link data\n\n')
+        self.write('* Link data\n\n')
         for link_type in self.network.get_link_types(template_id=self.template_id):
-            data.append('* Data for link type %s\n\n' % link_type)
+            self.write('* Data for link type %s\n\n' % link_type)
             links = self.network.get_link(link_type=link_type)
-            data.extend(self.export_parameters_using_type(links, link_type, 'scalar', res_type='LINK'))
-            data.extend(self.export_parameters_using_type(links, link_type,'descriptor', res_type='LINK'))
-            data.extend(self.export_timeseries_using_type(links, link_type, res_type='LINK'))
+            self.write_section('link type %s scalar' % link_type,
+                               self.get_resource_inputs(links, ('scalar',)),
+                               self.export_parameters_using_type,
+                               links, link_type, 'scalar', res_type='LINK')
+            self.write_section('link type %s descriptor' % link_type,
+                               self.get_resource_inputs(links, ('descriptor',)),
+                               self.export_parameters_using_type,
+                               links, link_type, 'descriptor', res_type='LINK')
+            self.write_section('link type %s timeseries' % link_type,
+                               [self.time_index,
+                                self.get_resource_inputs(links, ('timeseries',))],
+                               self.export_timeseries_using_type,
+                               links, link_type, res_type='LINK')
             self.export_arrays(links)
-        self.output = "%s%s"%(self.output, ''.join(data))
         log.info("Data exported")
 
     def export_data_using_attributes (self):
@@ -298,22 +529,48 @@ class GAMSExporter(JSONPlugin):
         # Export node data for each node
 
         self.time_table={}
-        data = ['* Network data\n']
-        data.extend(self.export_parameters_using_attributes([self.network],'scalar',res_type='NETWORK'))
-        data.append('\n* Nodes data\n')
-        data.extend(self.export_parameters_using_attributes(self.network.nodes,'scalar'))
-        data.extend(self.export_parameters_using_attributes (self.network.nodes,'descriptor'))
-        data.extend(self.export_timeseries_using_attributes (self.network.nodes))
-        data.extend(self.export_arrays(self.network.nodes)) #?????
+        self.load_timeseries()
+        nodes = self.network.nodes
+        links = self.network.links
+        self.write('* Network data\n')
+        self.write_section('network scalar',
+                           self.get_resource_inputs([self.network], ('scalar',)),
+                           self.export_parameters_using_attributes,
+                           [self.network], 'scalar', res_type='NETWORK')
+        self.write('\n* Nodes data\n')
+        self.write_section('node scalar',
+                           self.get_resource_inputs(nodes, ('scalar',)),
+                           self.export_parameters_using_attributes,
+                           nodes, 'scalar')
+        self.write_section('node descriptor',
+                           self.get_resource_inputs(nodes, ('descriptor',)),
+                           self.export_parameters_using_attributes,
+                           nodes, 'descriptor')
+        self.write_section('node timeseries',
+                           [self.time_index,
+                            self.get_resource_inputs(nodes, ('timeseries',))],
+                           self.export_timeseries_using_attributes, nodes)
+        self.write_section('node array',
+                           self.get_resource_inputs(nodes, ('array',)),
+                           self.export_arrays, nodes) #?????
 
         # Export link data for each node
-        data.append('* Links data\n')
+        self.write('* Links data\n')
         #links = self.network.get_link(link_type=link_type)
-        data.extend(self.export_parameters_using_attributes (self.network.links,'scalar', res_type='LINK'))
-        data.extend(self.export_parameters_using_attributes (self.network.links, 'descriptor', res_type='LINK'))
-        data.extend(self.export_timeseries_using_attributes (self.network.links, res_type='LINK'))
+        self.write_section('link scalar',
+                           self.get_resource_inputs(links, ('scalar',)),
+                           self.export_parameters_using_attributes,
+                           links, 'scalar', res_type='LINK')
+        self.write_section('link descriptor',
+                           self.get_resource_inputs(links, ('descriptor',)),
+                           self.export_parameters_using_attributes,
+                           links, 'descriptor', res_type='LINK')
+        self.write_section('link timeseries',
+                           [self.time_index,
+                            self.get_resource_inputs(links, ('timeseries',))],
+                           self.export_timeseries_using_attributes,
+                           links, res_type='LINK')
         self.export_arrays(self.network.links) #??????
-        self.output = "%s%s"%(self.output, ''.join(data))
         log.info("Data exported")
 
     def export_parameters_using_type(self, resources, obj_type, datatype, res_type=None):
@@ -325,8 +582,8 @@ class GAMSExporter(JSONPlugin):
         attr_names = []
         attr_outputs = []
         for resource in resources:
-            for attr in resource.attributes:
-                if attr.dataset_type == datatype and attr.is_var is False:
+            for attr in self.network.get_resource_attributes(resource, datatype):
+                if attr.is_var is False:
                     translated_attr_name = translate_attr_name(attr.name)
                     attr.name = translated_attr_name
                     if attr.name not in attr_names:
@@ -369,7 +626,7 @@ class GAMSExporter(JSONPlugin):
                     attr_outputs.append('{0:24}'.format(resource.name))
 
                 for attribute in attributes:
-                    attr = resource.get_attribute(attr_name=attribute.name)
+                    attr = self.network.get_resource_attribute(resource, attribute.name)
 
                     if attr is None or attr.value is None or attr.dataset_type != datatype:
                         continue
@@ -410,8 +667,8 @@ class GAMSExporter(JSONPlugin):
             attr_names = []
             attr_outputs = []
             for resource in resources:
-                for attr in resource.attributes:
-                    if attr.dataset_type == datatype and attr.is_var is False:
+                for attr in self.network.get_resource_attributes(resource, datatype):
+                    if attr.is_var is False:
                         translated_attr_name = translate_attr_name(attr.name)
                         attr.name = translated_attr_name
                         if attr.name not in attr_names:
@@ -436,7 +693,7 @@ class GAMSExporter(JSONPlugin):
                 attr_outputs.append('\n')
 
                 for resource in resources:
-                    attr = resource.get_attribute(attr_name=attribute.name)
+                    attr = self.network.get_resource_attribute(resource, attribute.name)
 
                     if attr is None or attr.value is None or attr.dataset_type != datatype:
                         continue
@@ -469,8 +726,8 @@ class GAMSExporter(JSONPlugin):
 
         #Identify only the timeseries values we're interested in.
         for resource in resources:
-            for attr in resource.attributes:
-                if attr.dataset_type == 'timeseries' and attr.is_var is False:
+            for attr in self.network.get_resource_attributes(resource, 'timeseries'):
+                if attr.is_var is False:
                     attr.name = translate_attr_name(attr.name)
                     if attr.name not in attr_names:
                         attributes.append(attr)
@@ -494,7 +751,7 @@ class GAMSExporter(JSONPlugin):
             col_header_length = dict()
             for attribute in attributes:
                 for resource in resources:
-                    attr = resource.get_attribute(attr_name=attribute.name)
+                    attr = self.network.get_resource_attribute(resource, attribute.name)
                     if attr is not None and attr.dataset_id is not None:
                         if islink:
                             col_header = ' %14s' % (resource.gams_name + '.'
@@ -510,44 +767,54 @@ class GAMSExporter(JSONPlugin):
                             attr_outputs.append(col_header)
 
             attr_outputs.append('\n')
-            resource_data_cache = {}
-            for timestamp in self.time_index:
+
+            if self.timeseries is None:
+                #Without a time index the table has no rows
+                attr_outputs.append('\n')
+                return attr_outputs
+
+            #The values of every column, aligned to the time index
+            columns = []
+            rows = []
+            for attribute in attributes:
+                for resource in resources:
+                    attr = self.network.get_resource_attribute(resource, attribute.name)
+
+                    #Only interested in attributes with data
+                    if attr is None or attr.dataset_id is None:
+                        continue
+
+                    columns.append((self.get_timeseries_values(resource, attr),
+                                    col_header_length[(attribute, resource)]))
+                    rows.append(self.timeseries.get_row(id(attr)))
+
+            if None not in rows:
+                #All columns are numeric, render the table in one block
+                precision = self.precision if self.precision is not None else 6
+                attr_outputs.append(format_table(
+                    [self.times_table[timestamp] for timestamp in self.time_index],
+                    self.timeseries.values[rows].T,
+                    [col_length for all_data, col_length in columns],
+                    align='right',
+                    precision=precision,
+                    label_format='%-7s'))
+                attr_outputs.append('\n')
+                return attr_outputs
+
+            for t, timestamp in enumerate(self.time_index):
                 attr_outputs.append('{0:<7}'.format(self.times_table[timestamp]))
 
-                for attribute in attributes:
-                    for resource in resources:
-                        attr = resource.get_attribute(attr_name=attribute.name)
-
-                        #Only interested in attributes with data
-                        if attr is None or attr.dataset_id is None:
-                            continue
-
-                        #Pass in the JSON value and the list of timestamps,
-                        #Get back a dictionary with values, keyed on the timestamps
-                        try:
-                            all_data = resource_data_cache.get((resource.name, attribute.name))
-                            if all_data is None:
-                                all_data = self.get_time_value(attr.value, self.time_index)
-                                resource_data_cache[(resource.name, attribute.name)] = all_data
-                        except Exception as e:
-                            log.exception(e)
-                            all_data = None
-
-                        if all_data is None:
-                            raise HydraPluginError("Error finding value attribute %s on"
-                                                  "resource %s"%(attr.name, resource.name))
-
-                        #Get each value in turn and add it to the line
-                        data = all_data[timestamp]
-
-                        try:
-                            data_str = ' %14f' % float(data)
-                        except:
-                            ff_='{0:<'+self.array_len+'}'
-                            data_str = ff_.format(str(data))
+                for all_data, col_length in columns:
+                    #Get each value in turn and add it to the line
+                    data = all_data[t]
 
-                        attr_outputs.append(
-                            data_str.rjust(col_header_length[(attribute, resource)]))
+                    try:
+                        data_str = ' %14f' % float(data)
+                    except:
+                        ff_='{0:<'+self.array_len+'}'
+                        data_str = ff_.format(str(data))
+
+                    attr_outputs.append(data_str.rjust(col_length))
 
                 attr_outputs.append('\n')
             attr_outputs.append('\n')
@@ -566,8 +833,8 @@ class GAMSExporter(JSONPlugin):
             #Identify all the timeseries attributes and unique attribute
             #names
             for resource in resources:
-                for attr in resource.attributes:
-                    if attr.dataset_type == 'timeseries' and attr.is_var is False:
+                for attr in self.network.get_resource_attributes(resource, 'timeseries'):
+                    if attr.is_var is False:
                         attr.name = translate_attr_name(attr.name)
                         if attr.name not in attr_names:
                             attributes.append(attr)
@@ -607,38 +874,43 @@ class GAMSExporter(JSONPlugin):
 
 
 
+                #Numeric series are rendered in blocks, straight from the
+                #time series matrix.
+                block_labels = []
+                block_rows = []
+
                 #Identify the datasets that we need data for
                 for resource in resources:
-                    attr = resource.get_attribute(attr_name=attribute.name)
+                    attr = self.network.get_resource_attribute(resource, attribute.name)
 
                     #Only interested in attributes with data and that are timeseries
                     if attr is None or attr.dataset_id is None or attr.dataset_type != "timeseries":
                         continue
 
-                    #Pass in the JSON value and the list of timestamps,
-                    #Get back a dictionary with values, keyed on the timestamps
-                    try:
-                        all_data = self.get_time_value(attr.value, self.time_index)
-                    except Exception as e:
-                        log.exception(e)
-                        all_data = None
-
-                    if all_data is None:
-                        raise HydraPluginError("Error finding value attribute %s on"
-                                              "resource %s"%(attr.name, resource.name))
                     if islink:
                         if self.links_as_name:
-                            attr_outputs.append('\n'+ff.format(resource.name+ '.'+resource.from_node+'.'+resource.to_node))
-                            attr_outputs.append(ff.format('\t'))
-
+                            label = ff.format(resource.name+ '.'+resource.from_node+'.'+resource.to_node) + ff.format('\t')
                         else:
-                            attr_outputs.append('\n'+ff.format(resource.gams_name))
+                            label = ff.format(resource.gams_name)
                     else:
-                        attr_outputs.append('\n'+ff.format(resource.name))
+                        label = ff.format(resource.name)
+
+                    row = self.timeseries.get_row(id(attr)) if self.timeseries is not None else None
+                    if row is not None:
+                        block_labels.append(label)
+                        block_rows.append(row)
+                        continue
+
+                    all_data = self.get_timeseries_values(resource, attr)
+
+                    attr_outputs.append(self.format_timeseries_block(block_labels, block_rows))
+                    block_labels = []
+                    block_rows = []
+
+                    attr_outputs.append('\n' + label)
 
                     #Get each value in turn and add it to the line
-                    for timestamp in self.time_index:
-                        tmp = all_data[timestamp]
+                    for tmp in all_data:
 
                         if isinstance(tmp, list):
                             data="-".join(tmp)
@@ -649,12 +921,59 @@ class GAMSExporter(JSONPlugin):
                             data_str = ff.format(str(float(data)))
                         attr_outputs.append(data_str)
 
+                attr_outputs.append(self.format_timeseries_block(block_labels, block_rows))
                 attr_outputs.append('\n')
 
             attr_outputs.append('\n')
 
             return attr_outputs
 
+    def load_timeseries(self):
+        """
+        Parse every time series of the network once and align all of them
+        to the time index in one pass, see TimeSeriesMatrix.
+        """
+        if len(self.time_index) == 0:
+            return
+
+        series = []
+        for resource in [self.network] + self.network.nodes + self.network.links:
+            for attr in self.network.get_resource_attributes(resource, 'timeseries'):
+                if attr.is_var is False and attr.dataset_id is not None:
+                    series.append((id(attr), attr.value))
+
+        log.info("Reindexing %s time series", len(series))
+        self.timeseries = TimeSeriesMatrix(self.time_index)
+        self.timeseries.load(series)
+
+    def format_timeseries_block(self, labels, rows):
+        """
+            Render rows of the time series matrix as lines of a table
+            with one column per time step.
+        """
+        if len(rows) == 0:
+            return ''
+        return format_table(labels,
+                            self.timeseries.values[rows],
+                            int(self.name_len),
+                            precision=self.precision,
+                            line_start='\n',
+                            line_end='')
+
+    def get_timeseries_values(self, resource, attr):
+        """
+            Return the values of a time series attribute for every step
+            of the time index.
+        """
+        all_data = None
+        if self.timeseries is not None:
+            all_data = self.timeseries.get(id(attr))
+
+        if all_data is None:
+            raise HydraPluginError("Error finding value attribute %s on"
+                                  "resource %s"%(attr.name, resource.name))
+        return all_data
+
     def get_time_value(self, value, timestamps):
         '''
             get data for timesamp
@@ -706,8 +1025,8 @@ class GAMSExporter(JSONPlugin):
         attr_outputs = []
         ff='{0:<'+self.name_len+'}'
         for resource in resources:
-            for attr in resource.attributes:
-                if attr.dataset_type == 'array' and attr.is_var is False:
+            for attr in self.network.get_resource_attributes(resource, 'array'):
+                if attr.is_var is False:
                     attr.name = translate_attr_name(attr.name)
                     if attr.name not in attr_names:
                         attributes.append(attr)
@@ -720,7 +1039,7 @@ class GAMSExporter(JSONPlugin):
                 # This exporter only supports 'rectangular' arrays
                 dim_=None
                 for resource in resources:
-                    attr = resource.get_attribute(attr_name=attribute.name)
+                    attr = self.network.get_resource_attribute(resource, attribute.name)
                     if attr is not None and attr.value is not None:
                         array=json.loads(attr.value)
                         dim = self.get_dim(array)
@@ -753,7 +1072,7 @@ class GAMSExporter(JSONPlugin):
                 attr_outputs.append('\n')
 
                 for resource in resources:
-                    attr = resource.get_attribute(attr_name=attribute.name)
+                    attr = self.network.get_resource_attribute(resource, attribute.name)
                     if attr is not None and attr.value is not None:
                         array=json.loads(attr.value)
                         #dim = self.get_dim(array)
@@ -836,6 +1155,22 @@ class GAMSExporter(JSONPlugin):
                 days.append((date.day))
         return years, months, days
 
+    def set_time_index(self):
+        """
+            Fill the time index from the time axis and map every time step
+            to its GAMS label. Does nothing without a time axis.
+        """
+        if self.time_axis is None:
+            return
+        self.time_index = []
+        self.times_table = {}
+        for t, date in enumerate(self.time_axis):
+            self.time_index.append(date)
+            if self.use_gams_date_index is True:
+                self.times_table[date]=str(date.year)+" . "+str(date.month)+" . "+str(date.day)
+            else:
+                self.times_table[date]=t
+
     def write_time_index(self):
         """
             Using the time-axis determined in __init__, write the time
@@ -845,91 +1180,323 @@ class GAMSExporter(JSONPlugin):
             return
         log.info("Writing time index")
 
-        self.times_table={}
         try:
+            self.set_time_index()
+            self.write_section('time index', [self.time_axis],
+                               self.export_time_index)
+            log.info("Time index written")
+        except Exception as e:
+            log.exception(e)
+            raise HydraPluginError("Please check time-axis or start time, end times and time step.")
+
+    def export_time_index(self):
+        """
+            Return the time index sets and the timestamp parameter.
+        """
+        if self.use_gams_date_index is True:
+            years, months, days= self.get_years_months_days()
+
+            t='SETS\n yr  /\n'
+            for year in years:
+                t=t+str(year)+'\n'
+            t=t+'/\n\n'
+
+            t=t+'SETS\n mn  /\n'
+            for month in months:
+                t=t+str(month)+'\n'
+            t=t+'/\n\n'
+            t=t+'SETS\n dy  /\n'
+            for day in days:
+                  t=t+str(day)+'\n'
+            #t=t+'/\n\n'
+            time_index = [t+'\n\n']####', '* Time index\n','t(yr, mn, dy)  time index /\n']
+        else:
+            time_index = ['SETS\n\n', '* Time index\n','t time index /\n']
+
+        self.set_time_index()
+        if self.use_gams_date_index is False:
+            for t in range(len(self.time_index)):
+                time_index.append('%s\n' % t)
+
+        time_index.append('/\n\n')
+
+        time_index.append('* define time steps dependent on time index (t)\n\n')
+        if self.use_gams_date_index is True:
+            time_index.append('Parameter timestamp(yr, mn, dy) ;\n\n')
+        else:
+            time_index.append('Parameter timestamp(t) ;\n\n')
+        #print "wrinting time"
+        for t, date in enumerate(self.time_index):
             if self.use_gams_date_index is True:
-                years, months, days= self.get_years_months_days()
-
-                t='SETS\n yr  /\n'
-                for year in years:
-                    t=t+str(year)+'\n'
-                t=t+'/\n\n'
-
-                t=t+'SETS\n mn  /\n'
-                for month in months:
-                    t=t+str(month)+'\n'
-                t=t+'/\n\n'
-                t=t+'SETS\n dy  /\n'
-                for day in days:
-                      t=t+str(day)+'\n'
-                #t=t+'/\n\n'
-                time_index = [t+'\n\n']####', '* Time index\n','t(yr, mn, dy)  time index /\n']
+                keyy=str(date.year)+"\",\""+str(date.month)+"\", \""+str(date.day)
+                time_index.append('    timestamp("%s") = %s ;\n' % \
+                (keyy, convert_date_to_timeindex(date)))
             else:
-                time_index = ['SETS\n\n', '* Time index\n','t time index /\n']
+                time_index.append('    timestamp("%s") = %s ;\n' % \
+                (self.times_table[date], convert_date_to_timeindex(date)))
+        time_index.append('\n\n')
+        return time_index
 
-            t = 0
-            for date in self.time_axis:
-                self.time_index.append(date)
-                if self.use_gams_date_index is True:
-                     _t=str(date.year)+" . "+str(date.month)+" . "+str(date.day)
-                     self.times_table[date]=_t
-                else:
-                     time_index.append('%s\n' % t)
-                     self.times_table[date]=t
-                t += 1
+    def export_gdx(self, gams_path=None):
+        """
+            Write the network, time index and data to a GDX file instead of
+            a text file.
+        """
+        writer = GDXSymbolWriter(self.filename, gams_path=gams_path)
+        try:
+            self.export_symbols(writer)
+        finally:
+            writer.close()
 
-            time_index.append('/\n\n')
+    def export_database(self, database):
+        """
+            Add the network, time index and data to a GamsDatabase, which is
+            handed to the GAMS job in memory.
+        """
+        self.export_symbols(DatabaseSymbolWriter(database))
 
-            time_index.append('* define time steps dependent on time index (t)\n\n')
-            if self.use_gams_date_index is True:
-                time_index.append('Parameter timestamp(yr, mn, dy) ;\n\n')
+    def export_symbols(self, writer):
+        """
+            Export the network, the time index and the data as sets and
+            parameters to a SymbolWriter. The symbols are the same as in the
+            text output; data is always exported by attribute.
+        """
+        if self.links_as_name is False:
+            self.check_links_between_nodes()
+        log.info("Exporting network symbols")
+        self.export_network_symbols(writer)
+        if self.time_axis is not None:
+            log.info("Exporting time index symbols")
+            try:
+                self.set_time_index()
+            except Exception as e:
+                log.exception(e)
+                raise HydraPluginError("Please check time-axis or start time, end times and time step.")
+            self.export_time_symbols(writer)
+        log.info("Exporting data symbols")
+        self.load_timeseries()
+        self.export_data_symbols(writer)
+        log.info("Data exported")
+
+    def get_link_keys(self, link):
+        if self.links_as_name:
+            return [link.name, link.from_node, link.to_node]
+        return [link.from_node, link.to_node]
+
+    def get_resource_keys(self, resource, res_type):
+        if res_type == 'NETWORK':
+            return []
+        elif res_type == 'LINK':
+            return self.get_link_keys(resource)
+        return [resource.name]
+
+    def get_time_keys(self):
+        if self.use_gams_date_index is True:
+            return [[str(date.year), str(date.month), str(date.day)]
+                    for date in self.time_index]
+        return [[str(t)] for t in range(len(self.time_index))]
+
+    def get_unique_attributes(self, resources, datatype):
+        """
+            Return the input attributes of type ``datatype`` of a list of
+            resources, one per (translated) attribute name.
+        """
+        attributes = []
+        attr_names = set()
+        for resource in resources:
+            for attr in self.network.get_resource_attributes(resource, datatype):
+                if attr.is_var is False:
+                    attr.name = translate_attr_name(attr.name)
+                    if attr.name not in attr_names:
+                        attributes.append(attr)
+                        attr_names.add(attr.name)
+        return attributes
+
+    def export_network_symbols(self, writer):
+        nodes = self.network.nodes
+        links = self.network.links
+        link_dim = 3 if self.links_as_name else 2
+
+        writer.add_set('i', 1, [[node.name] for node in nodes], 'vector of all nodes')
+        writer.add_alias('i', 'j')
+        for object_type in self.network.get_node_types(template_id=self.template_id):
+            writer.add_set(object_type, 1,
+                           [[node.name] for node in self.network.get_node(node_type=object_type)])
+
+        node_groups = [group for group in self.network.groups
+                       if len(self.network.get_node(group=group.ID)) > 0]
+        if len(node_groups) > 0:
+            writer.add_set('node_groups', 1, [[group.name] for group in node_groups],
+                           'vector of all node groups')
+            for group in node_groups:
+                writer.add_set(group.name, 1,
+                               [[node.name] for node in self.network.get_node(group=group.ID)])
+
+        if self.links_as_name:
+            writer.add_set('link_name', 1, [[link.name] for link in links])
+        writer.add_set('links', link_dim, [self.get_link_keys(link) for link in links],
+                       'vector of all links')
+        for object_type in self.network.get_link_types(template_id=self.template_id):
+            type_links = self.network.get_link(link_type=object_type)
+            if self.links_as_name:
+                writer.add_set(object_type, 1, [[link.name] for link in type_links])
             else:
-                time_index.append('Parameter timestamp(t) ;\n\n')
-            #print "wrinting time"
-            for t, date in enumerate(self.time_index):
-                if self.use_gams_date_index is True:
-                    keyy=str(date.year)+"\",\""+str(date.month)+"\", \""+str(date.day)
-                    time_index.append('    timestamp("%s") = %s ;\n' % \
-                    (keyy, convert_date_to_timeindex(date)))
-                else:
-                    time_index.append('    timestamp("%s") = %s ;\n' % \
-                    (self.times_table[date], convert_date_to_timeindex(date)))
-            time_index.append('\n\n')
+                writer.add_set(object_type, 2, [self.get_link_keys(link) for link in type_links])
 
-            self.output = self.output + ''.join(time_index)
-            log.info("Time index written")
-        except Exception as e:
-            log.exception(e)
-            raise HydraPluginError("Please check time-axis or start time, end times and time step.")
+        link_groups = [group for group in self.network.groups
+                       if len(self.network.get_link(group=group.ID)) > 0]
+        if len(link_groups) > 0:
+            writer.add_set('link_groups', 1, [[group.name] for group in link_groups],
+                           'vector of all link groups')
+            for group in link_groups:
+                writer.add_set(group.name, 2,
+                               [[link.from_node, link.to_node]
+                                for link in self.network.get_link(group=group.ID)])
+
+        # Like the sparse text output, Connect only holds the existing
+        # connections.
+        node_index = dict((node.name, i) for i, node in enumerate(nodes))
+        connections = set()
+        for link in links:
+            connections.add((node_index[link.from_node], node_index[link.to_node]))
+        writer.add_parameter('Connect', 2,
+                             [([nodes[i].name, nodes[j].name], 1.0)
+                              for i, j in sorted(connections)])
+
+        writer.add_parameter('x_coord', 1, [([node.name], float(node.X)) for node in nodes])
+        writer.add_parameter('y_coord', 1, [([node.name], float(node.Y)) for node in nodes])
+
+    def export_time_symbols(self, writer):
+        time_keys = self.get_time_keys()
+        if self.use_gams_date_index is True:
+            years, months, days = self.get_years_months_days()
+            writer.add_set('yr', 1, [[str(year)] for year in years])
+            writer.add_set('mn', 1, [[str(month)] for month in months])
+            writer.add_set('dy', 1, [[str(day)] for day in days])
+        else:
+            writer.add_set('t', 1, time_keys, 'time index')
+        writer.add_parameter('timestamp', len(time_keys[0]) if time_keys else 1,
+                             [(keys, convert_date_to_timeindex(date))
+                              for keys, date in zip(time_keys, self.time_index)])
+
+    def export_data_symbols(self, writer):
+        self.export_parameter_symbols(writer, [self.network], 'scalar', 'NETWORK')
+        for resources, res_type in [(self.network.nodes, 'NODE'),
+                                    (self.network.links, 'LINK')]:
+            self.export_parameter_symbols(writer, resources, 'scalar', res_type)
+            self.export_parameter_symbols(writer, resources, 'descriptor', res_type)
+            self.export_timeseries_symbols(writer, resources, res_type)
+        self.export_array_symbols(writer, self.network.nodes)
+
+    def export_parameter_symbols(self, writer, resources, datatype, res_type):
+        """
+            Export scalars or descriptors. GDX parameters only hold numbers,
+            so descriptors with text values are skipped.
+        """
+        for attribute in self.get_unique_attributes(resources, datatype):
+            records = []
+            for resource in resources:
+                attr = self.network.get_resource_attribute(resource, attribute.name)
+                if attr is None or attr.value is None or attr.dataset_type != datatype:
+                    continue
+                try:
+                    value = float(attr.value)
+                except ValueError:
+                    log.warning("Value %s of attribute %s on %s is not a number, skipping it.",
+                                attr.value, attribute.name, resource.name)
+                    continue
+                records.append((self.get_resource_keys(resource, res_type), value))
+            dim = len(self.get_resource_keys(resources[0], res_type)) if resources else 0
+            writer.add_parameter(attribute.name, dim, records)
+
+    def export_timeseries_symbols(self, writer, resources, res_type):
+        """
+            Export time series, straight from the time series matrix.
+            Missing values are not written.
+        """
+        attributes = self.get_unique_attributes(resources, 'timeseries')
+        if len(attributes) > 0 and self.time_axis is None:
+            raise HydraPluginError("Missing time axis or start date, end date and time step or bad format")
+
+        time_keys = self.get_time_keys()
+        for attribute in attributes:
+            records = []
+            for resource in resources:
+                attr = self.network.get_resource_attribute(resource, attribute.name)
+                if attr is None or attr.dataset_id is None or attr.dataset_type != "timeseries":
+                    continue
+                keys = self.get_resource_keys(resource, res_type)
+                for t, value in enumerate(self.get_timeseries_values(resource, attr)):
+                    if value is None:
+                        continue
+                    if isinstance(value, list):
+                        log.warning("Time series %s on %s has more than one column, skipping it.",
+                                    attribute.name, resource.name)
+                        break
+                    records.append((keys + time_keys[t], float(value)))
+            dim = len(self.get_resource_keys(resources[0], res_type)) + len(time_keys[0])
+            writer.add_parameter(attribute.name, dim, records)
+
+    def export_array_symbols(self, writer, resources):
+        """
+            Export one dimensional arrays of numbers as a parameter (i, *)
+            and a set of array indices, like export_arrays.
+        """
+        for attribute in self.get_unique_attributes(resources, 'array'):
+            records = []
+            length = 0
+            for resource in resources:
+                attr = self.network.get_resource_attribute(resource, attribute.name)
+                if attr is None or attr.value is None:
+                    continue
+                array = json.loads(attr.value)
+                if len(self.get_dim(array)) != 1:
+                    log.warning("Array %s on %s has more than one dimension, skipping it.",
+                                attribute.name, resource.name)
+                    continue
+                length = max(length, len(array))
+                for k, item in enumerate(array):
+                    if item is not None:
+                        records.append(([resource.name, str(k + 1)], float(item)))
+            if len(records) == 0:
+                continue
+            writer.add_set(attribute.name + '_index', 1,
+                           [[str(k + 1)] for k in range(length)])
+            writer.add_parameter(attribute.name, 2, records)
 
     def write_file(self):
-        log.info("Writing file %s.", self.filename)
-        with open(self.filename, 'w') as f:
-            f.write(self.output)
-
-def translate_attr_name(name):
-    """Replace non alphanumeric characters with '_'. This function throws an
-    error, if the first letter of an attribute name is not an alphabetic
-    character.
-    """
-    if isinstance(name, str):
-        translator = ''.join(chr(c) if chr(c).isalnum()
-                             else '_' for c in range(256))
-    elif isinstance(name, unicode):
-        translator = UnicodeTranslate()
-
-    name = name.translate(translator)
-
-    return name
-
-
-class UnicodeTranslate(dict):
-    """Translate a unicode attribute name to a valid GAMS variable.
-    """
-    def __missing__(self, item):
-        char = unichr(item)
-        repl = u'_'
-        if item < 256 and char.isalnum():
-            repl = char
-        self[item] = repl
-        return repl
+        """
+            All sections have already been written to the sink while they
+            were exported, so only the sink needs to be closed.
+        """
+        log.info("Closing output %s.", self.sink)
+        self.sink.close()
+        if self.fragments is not None:
+            self.fragments.clean()
+        filename = getattr(self.sink, 'filename', None)
+        if filename is not None:
+            self.write_index_file(get_index_file_name(filename))
+
+    def write_index_file(self, filename):
+        """
+            Write the network and scenario id, the time axis and the names of
+            nodes and links to a JSON file, so that the importer doesn't need
+            to parse them from the data file.
+        """
+        time_axis = []
+        for t, date in enumerate(self.time_index):
+            time_axis.append([t, '%s' % convert_date_to_timeindex(date)])
+        index = dict(network_id=self.network.ID,
+                     scenario_id=self.network.scenario_id,
+                     use_gams_date_index=self.use_gams_date_index,
+                     time_axis=time_axis,
+                     nodes=dict((node.name, node.ID)
+                                for node in self.network.nodes),
+                     links=dict((link.name, dict(id=link.ID,
+                                                 from_node=link.from_node,
+                                                 to_node=link.to_node,
+                                                 gams_name=link.gams_name))
+                                for link in self.network.links))
+        with open(filename, 'w') as f:
+            json.dump(index, f)
+        log.info("Index written to %s.", filename)
@@ -2,6 +2,7 @@
 
 import os
 import sys
+import fnmatch
 
 from hydra_client.resources import HydraResource, HydraNetwork
 from hydra_base.exceptions import HydraPluginError
@@ -15,6 +16,9 @@ from config import model_status_map, \
 import logging
 log = logging.getLogger(__name__)
 
+# Line of a model after which the scenario is solved from a checkpoint
+checkpoint_marker = '*$hydra_checkpoint'
+
 class GamsModel(object):
 
     def __init__(self, gamspath, working_directory):
@@ -29,6 +33,7 @@ class GamsModel(object):
                 sys.path.insert(0, api_path)
             from gams import  workspace
             self.ws = workspace.GamsWorkspace(working_directory=working_directory, system_directory=gamspath, debug = 1)
+            self.databases = []
 
         except Exception as e:
             raise HydraPluginError("Unable to import modules from gams. Please ensure that gams with version greater than 24.1 is installed.")
@@ -42,15 +47,108 @@ class GamsModel(object):
        self.cp = self.ws.add_checkpoint()
        with open (model_file, "r") as myfile:
             model=myfile.read()
-       self.model_name=self.get_model_name(model)
-       if self.model_name is not None:
-           self.model_name=self.model_name.replace(";", "")
-           model=model+"\nscalar ms; \nms="+self.model_name.strip()+".Modelstat; "
-           model = model + "\nscalar Sos; \nSos=" + self.model_name.strip() + ".Solvestat; "
-           #model = model + "\nscalar TSos; \nTSos=" + self.model_name.strip() + ".Tsolstat; "
+       self.set_model_name(model)
+       model = self.add_status_scalars(model)
 
        self.job = self.ws.add_job_from_string(model)
 
+    def set_model_name(self, model):
+        self.model_name=self.get_model_name(model)
+        if self.model_name is not None:
+            self.model_name=self.model_name.replace(";", "")
+
+    def add_status_scalars(self, model):
+        """
+        Add the model and solver status scalars to the end of the model
+        string, which are checked by run.
+        """
+        if self.model_name is not None:
+            model=model+"\nscalar ms; \nms="+self.model_name.strip()+".Modelstat; "
+            model = model + "\nscalar Sos; \nSos=" + self.model_name.strip() + ".Solvestat; "
+            #model = model + "\nscalar TSos; \nTSos=" + self.model_name.strip() + ".Tsolstat; "
+        return model
+
+    def add_checkpoint_job(self, model_file):
+        """
+        Prepare the model to be solved for several scenarios. The model is
+        split at the line ``*$hydra_checkpoint`` (see
+        get_checkpoint_line): run_checkpoint compiles and runs the first
+        part once, with the data of a base scenario, and saves it to the
+        checkpoint self.cp. run_scenario then only runs the rest of the
+        model from the checkpoint, after loading the parameters which
+        differ from the base scenario.
+
+        Parameters are replaced as they are, anything the first part of the
+        model calculates from them keeps the values of the base scenario.
+        The marker must therefore come after the declarations and data,
+        but before any calculation which uses scenario data.
+        """
+        with open (model_file, "r") as myfile:
+            model=myfile.read()
+        lines = model.split("\n")
+        i = self.get_checkpoint_line(lines)
+        if i is None:
+            raise HydraPluginError("The model has no %s line, it can't be "
+                                   "solved from a checkpoint." %
+                                   checkpoint_marker)
+        self.cp = self.ws.add_checkpoint()
+        self.set_model_name(model)
+        self.checkpoint_job = self.ws.add_job_from_string("\n".join(lines[:i]))
+        self.solve_model = self.add_status_scalars("\n".join(lines[i + 1:]))
+
+    @staticmethod
+    def get_checkpoint_line(lines):
+        """
+        Return the index of the line marking the end of the part of the
+        model which is saved to the checkpoint, or None if the model has no
+        such line. The marker is a comment, so it doesn't change normal
+        runs of the model.
+        """
+        for i, line in enumerate(lines):
+            if line.strip().lower() == checkpoint_marker:
+                return i
+        return None
+
+    def run_checkpoint(self):
+        """
+        Run the first part of the model, prepared by add_checkpoint_job, and
+        save it to the checkpoint.
+        """
+        self.checkpoint_job.run(checkpoint=self.cp,
+                                databases=self.databases or None)
+
+    def add_scenario_database(self):
+        """
+        Return a database for the parameters of a scenario, which are loaded
+        by run_scenario.
+        """
+        return self.ws.add_database(in_model_name='hydra_scenario')
+
+    def run_scenario(self, database=None, parameters=()):
+        """
+        Solve the model from the checkpoint. ``parameters`` are the names of
+        parameters which are loaded from ``database`` (see
+        add_scenario_database) before the model is solved, replacing their
+        values in the checkpoint. Returns the output database of the job.
+        """
+        model = self.solve_model
+        if len(parameters) > 0:
+            model = "execute_load '%%hydra_scenario%%', %s;\n%s" % \
+                (', '.join(parameters), model)
+        self.job = self.ws.add_job_from_string(model, checkpoint=self.cp)
+        self.job.run(databases=[database] if len(parameters) > 0 else None)
+        self.check_status()
+        return self.job.out_db
+
+
+    def add_database(self, in_model_name='hydra_data'):
+        """
+        Add a database to the workspace, which is passed to the job when the
+        model is run. The model reads it with $gdxin %hydra_data%.
+        """
+        database = self.ws.add_database(in_model_name=in_model_name)
+        self.databases.append(database)
+        return database
 
     def get_model_name(self, model):
         '''
@@ -108,7 +206,14 @@ class GamsModel(object):
         run the GAMS model
         and raise an error if something going wrong
         '''
-        self.job.run(checkpoint=self.cp)#, gams_options=options.ESolPrint)
+        self.job.run(checkpoint=self.cp, databases=self.databases or None)#, gams_options=options.ESolPrint)
+        self.check_status()
+
+    def check_status(self):
+        """
+        Raise an error if the model or the solver of the last job didn't
+        terminate normally.
+        """
         if self.model_name is not None:
             try:
                 status=self.job.out_db["ms"].find_record().value
@@ -126,7 +231,102 @@ class GamsModel(object):
                 raise HydraPluginError("Model error: "+str(modelerror)+"\nSolver error: "+str(solvererror))
 
 
+class ResourceIndex(object):
+    """
+    Hash indexes on a list of nodes or links, by id, name, type and group.
+    """
+    def __init__(self):
+        self.by_id = dict()
+        self.by_name = dict()
+        self.by_type = dict()
+        self.by_group = dict()
+
+    def add(self, resource):
+        self.by_id[resource.ID] = resource
+        self.by_name.setdefault(resource.name, resource)
+        for res_type in set(resource.template.values()):
+            self.by_type.setdefault(res_type, []).append(resource)
+        for group_id in resource.groups:
+            self.by_group.setdefault(group_id, []).append(resource)
+
+    def get(self, name=None, res_id=None, res_type=None, group=None):
+        if name is not None:
+            return self.by_name.get(name)
+        elif res_id is not None:
+            return self.by_id.get(res_id)
+        elif res_type is not None:
+            return list(self.by_type.get(res_type, []))
+        elif group is not None:
+            return list(self.by_group.get(group, []))
+
+
 class GAMSnetwork(HydraNetwork):
+    """
+    A HydraNetwork which indexes its nodes, links and attributes while it is
+    loaded, so that lookups by name, id, type, group, attribute name and
+    dataset type don't scan the whole network.
+    """
+    def __init__(self):
+        super(GAMSnetwork, self).__init__()
+        # HydraNetwork keeps these lists on the class, so all networks
+        # loaded in one process would share their nodes and links
+        self.nodes = []
+        self.links = []
+        self.groups = []
+        self.node_groups = []
+        self.link_groups = []
+        self.node_index = ResourceIndex()
+        self.link_index = ResourceIndex()
+        self.attr_index = dict()
+        self.dataset_type_index = dict()
+
+    def load(self, soap_net, soap_attrs):
+        super(GAMSnetwork, self).load(soap_net, soap_attrs)
+        self.index_attributes(self)
+
+    def add_node(self, node):
+        super(GAMSnetwork, self).add_node(node)
+        self.node_index.add(node)
+        self.index_attributes(node)
+
+    def add_link(self, link):
+        super(GAMSnetwork, self).add_link(link)
+        self.link_index.add(link)
+        self.index_attributes(link)
+
+    def index_attributes(self, resource):
+        """
+        Index the attributes of a resource by their GAMS name (see
+        translate_attr_name) and by dataset type. Like
+        HydraResource.get_attribute, names are not case sensitive.
+        """
+        key = id(resource)
+        for attr in resource.attributes:
+            self.attr_index.setdefault((key, translate_attr_name(attr.name).lower()), attr)
+            self.dataset_type_index.setdefault((key, attr.dataset_type), []).append(attr)
+
+    def get_resource_attribute(self, resource, attr_name):
+        """
+        Return the attribute ``attr_name`` of a node, link or the network
+        itself, or None if the resource doesn't have this attribute.
+        """
+        return self.attr_index.get((id(resource), translate_attr_name(attr_name).lower()))
+
+    def get_resource_attributes(self, resource, dataset_type):
+        """
+        Return all attributes of a resource holding a dataset of type
+        ``dataset_type`` (scalar, descriptor, timeseries, array).
+        """
+        return self.dataset_type_index.get((id(resource), dataset_type), [])
+
+    def get_node(self, node_name=None, node_id=None, node_type=None,
+                 group=None):
+        return self.node_index.get(node_name, node_id, node_type, group)
+
+    def get_link(self, link_name=None, link_id=None, link_type=None,
+                 group=None):
+        return self.link_index.get(link_name, link_id, link_type, group)
+
     def gams_names_for_links(self, use_link_name=False):
         """
         Add a string to each link that can be used directly in GAMS code in
@@ -188,43 +388,201 @@ def create_arr_index(dim):
     return arr_idx
 
 
-def import_gms_data(filename):
+class UnicodeTranslate(dict):
+    """Translate a unicode attribute name to a valid GAMS variable.
     """
-    Read whole .gms file and expand all $ include statements found.
+    def __missing__(self, item):
+        char = unichr(item)
+        repl = u'_'
+        if item < 256 and char.isalnum():
+            repl = char
+        self[item] = repl
+        return repl
+
+
+# The translation tables are built once, names are translated for every
+# attribute lookup.
+str_translator = ''.join(chr(c) if chr(c).isalnum()
+                         else '_' for c in range(256))
+unicode_translator = UnicodeTranslate()
+
+
+def translate_attr_name(name):
+    """Replace non alphanumeric characters with '_'. This function throws an
+    error, if the first letter of an attribute name is not an alphabetic
+    character.
+    """
+    if isinstance(name, str):
+        translator = str_translator
+    elif isinstance(name, unicode):
+        translator = unicode_translator
+
+    name = name.translate(translator)
+
+    return name
+
+
+# The last .gms file read with read_gms_lines while skipping includes: its
+# name, the include pattern, the modification times of all files read and
+# its lines. Batch runs copy the model for every run, so only one model is
+# kept. Models read without skipping includes aren't kept at all, as they
+# hold the whole exported data.
+_gms_cache = None
+
+def get_include_file(line):
+    """
+    Return the file name of a $include statement, or None if the line isn't
+    one.
+    """
+    sline = line.strip()
+    if len(sline) == 0 or sline[0] != '$':
+        return None
+    lineparts = sline.split()
+    if len(lineparts) > 2 and \
+            lineparts[1] == 'include':
+        ff=sline
+        ff=ff.replace('$','')
+        ff=ff.replace('"','')
+        ff=ff.replace(';','')
+        ff=ff.replace('include','')
+        return ff.strip()
+    elif len(lineparts) == 2 and lineparts[0] == '$include':
+        return lineparts[1]
+    return None
+
+def iter_header_and_timestamps(f):
+    """
+    Yield the leading comment lines of a data file written by the exporter
+    (holding the network and scenario id) and its timestamp parameter.
+    """
+    in_header = True
+    in_timestamps = False
+    for line in f:
+        sline = line.strip()
+        if in_header:
+            if len(sline) == 0 or sline[0] == '*':
+                yield line
+                continue
+            in_header = False
+        if sline.startswith('Parameter timestamp('):
+            in_timestamps = True
+            yield line
+        elif in_timestamps:
+            if len(sline) == 0 or sline.startswith('timestamp'):
+                yield line
+            else:
+                in_timestamps = False
+
+def iter_gms_data(filename, skip_includes=None, files=None):
+    """
+    Yield the lines of a .gms file, expanding all $include statements. Files
+    included with a name matching the glob pattern ``skip_includes`` (e.g.
+    the data file written by the exporter) are not expanded, only their
+    header and timestamp parameter are read. The modification times of all
+    files read are appended to ``files``.
     """
     basepath = os.path.dirname(filename)
-    gms_data = ''
+    if files is not None:
+        files.append((filename, os.path.getmtime(filename)))
     with open(filename) as f:
-        while True:
-            line = f.readline()
-            if line == '':
-                break
-            sline = line.strip()
-            if len(sline) > 0 and sline[0] == '$':
-                lineparts = sline.split()
-                #lineparts2 = sline.split("\"")
-
-                if len(lineparts) > 2 and \
-                        lineparts[1] == 'include':
-                    ff=sline
-                    ff=ff.replace('$','')
-                    ff=ff.replace('"','')
-                    ff=ff.replace(';','')
-                    ff=ff.replace('include','')
-                    ff=ff.strip()
-                 ##   for ll in lineparts:
-                     ##    print ll
-                     ####    if(ll.__contains__('include')|ll.__contains__('$')):
-                        ##     continue
-
-                    ##     ff=ff+ll
-
-                    #line = import_gms_data(os.path.join(basepath, lineparts[2]))
-                    line = import_gms_data(os.path.join(basepath, ff))
-                elif len(lineparts) == 2 and lineparts[0] == '$include':
-                    line = import_gms_data(os.path.join(basepath, lineparts[1]))
-            gms_data += line
-    return gms_data
+        for line in f:
+            include = get_include_file(line)
+            if include is None:
+                yield line
+                continue
+            include = os.path.join(basepath, include)
+            if skip_includes is not None and \
+                    fnmatch.fnmatch(os.path.basename(include), skip_includes):
+                if files is not None:
+                    files.append((include, os.path.getmtime(include)))
+                with open(include) as inc:
+                    for inc_line in iter_header_and_timestamps(inc):
+                        yield inc_line
+            else:
+                for inc_line in iter_gms_data(include, skip_includes, files):
+                    yield inc_line
+
+def read_gms_lines(filename, skip_includes=None):
+    """
+    Return the lines of a .gms file, without line ends, with all $include
+    statements expanded (see ``iter_gms_data``), and the names of all files
+    read in the order they are read. If included files matching
+    ``skip_includes`` are skipped, the result is kept until the file or one
+    of its includes is modified.
+    """
+    global _gms_cache
+    filename = os.path.abspath(filename)
+    if skip_includes is not None and _gms_cache is not None and \
+            _gms_cache[:2] == (filename, skip_includes):
+        files, lines = _gms_cache[2:]
+        try:
+            if all(os.path.getmtime(f) == mtime for f, mtime in files):
+                return lines, [f for f, mtime in files]
+        except OSError:
+            pass
+
+    files = []
+    lines = []
+    # Included files may not end with a line end, their last line is then
+    # continued by the next line read
+    partial = ''
+    for line in iter_gms_data(filename, skip_includes, files):
+        if line.endswith('\n'):
+            lines.append(partial + line[:-1])
+            partial = ''
+        else:
+            partial += line
+    lines.append(partial)
+    if skip_includes is not None:
+        _gms_cache = (filename, skip_includes, files, lines)
+    return lines, [f for f, mtime in files]
+
+def import_gms_data(filename, skip_includes=None):
+    """
+    Read whole .gms file and expand all $ include statements found.
+    """
+    lines, files = read_gms_lines(filename, skip_includes)
+    return '\n'.join(lines)
+
+def get_index_file_name(filename):
+    """
+    Return the name of the index file written by the exporter next to a
+    data file. It holds the network and scenario id, the time axis and the
+    names of the nodes and links in JSON.
+    """
+    return filename + '.json'
+
+def copy_model(gms_file, directory, data_file=None):
+    """
+    Write a copy of a .gms file to ``directory`` so that the model can be
+    run there. $include statements of a file with the same name as
+    ``data_file``, the data exported for the run, include ``data_file``
+    instead, wherever the original model reads it from. Other relative
+    $include files which exist in ``directory`` are read from there, all
+    others from the directory of the original model. Returns the name of the
+    copy.
+    """
+    basepath = os.path.dirname(os.path.abspath(gms_file))
+    model_copy = os.path.join(directory, os.path.basename(gms_file))
+    if data_file is not None:
+        data_name = os.path.normcase(os.path.basename(data_file))
+    with open(gms_file) as f:
+        with open(model_copy, 'w') as out:
+            for line in f:
+                include = get_include_file(line)
+                if include is not None:
+                    include = include.strip('";')
+                    # Models written on Windows use \ in include paths
+                    include_name = os.path.normcase(
+                        os.path.basename(include.replace('\\', '/')))
+                    if data_file is not None and include_name == data_name:
+                        line = '$include "%s"\n' % os.path.abspath(data_file)
+                    elif not os.path.isabs(include) and not \
+                            os.path.exists(os.path.join(directory, include)):
+                        line = '$include "%s"\n' % \
+                            os.path.join(basepath, include)
+                out.write(line)
+    return model_copy
 
 def get_gams_path():
     """
@@ -290,6 +648,30 @@ def get_gams_path():
         return gams_path
 
 
+def import_gams_module(name, gams_path=None):
+    """
+    Import a module of the GAMS python API (e.g. gdxcc). If it is not on the
+    python path, the API folder of the GAMS installation is added first.
+    """
+    try:
+        return __import__(name)
+    except ImportError:
+        pass
+
+    if gams_path is None:
+        gams_path = get_gams_path()
+
+    real_path = os.path.realpath(os.path.abspath(gams_path))
+    api_path = os.path.join(real_path, 'apifiles', 'Python', 'api')
+    if api_path not in sys.path:
+        sys.path.insert(0, api_path)
+
+    try:
+        return __import__(name)
+    except ImportError:
+        raise HydraPluginError("Unable to import %s from gams. Please ensure that gams with version greater than 24.1 is installed." % name)
+
+
 key="12/FfCHspo*&s}:QMwd><s?:"
 lic_file="gasm_l.bin"
 REG_PATH="gams\lic"
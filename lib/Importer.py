@@ -4,8 +4,12 @@ import os
 import sys
 import re
 import logging
-import json
 import copy
+import json
+import time
+import multiprocessing
+
+import numpy as np
 
 from decimal import Decimal
 from operator import mul
@@ -14,27 +18,209 @@ from hydra_base.exceptions import HydraPluginError
 from hydra_base.util.hydra_dateutil import ordinal_to_timestamp, date_to_string
 from hydra_client.plugin import JSONPlugin
 
-from HydraGAMSlib import import_gms_data, get_gams_path
+from HydraGAMSlib import read_gms_lines, get_gams_path
+from HydraGAMSlib import get_index_file_name
+from HydraGAMSlib import convert_date_to_timeindex
+from AttributeCatalog import get_attribute_catalog
 
 log = logging.getLogger(__name__)
 
+# Lines opening a declaration block of the .gms file, e.g. 'positive variables'
+declaration_re = re.compile(r'^((free|positive|negative|binary|integer)\s+)?'
+                            r'variables?$|^(parameters?|scalars?|sets?|'
+                            r'tables?|equations?)$')
+
 gdxcc=None
 class GDXvariable(object):
-    def __init__(self):
+    """
+    A symbol read from a GDX file. Records are stored as an array of UEL
+    (element) codes with one row per record and one column per dimension,
+    and a float array of values (the level of variables). ``index`` and
+    ``data`` give the records as lists of element names and values.
+
+    If a ``loader`` is given, records are only read the first time they are
+    used, by calling ``loader(self)``.
+    """
+    def __init__(self, loader=None):
         self.name = None
         self.dim = 0
         self.records = 0
         self.description = None
         self.datatype = None
-        self.data = []
-        self.index = []
+        self.symbol_nr = None
+        self.loader = loader
+        self._keys = None
+        self._values = None
+        self.uels = []
+        self._index = None
+        self._data = None
+        self._element_index = None
+        self._pair_index = None
+        self._groups = dict()
+
+    def __getstate__(self):
+        # Send the records to worker processes, not the loader
+        self.keys
+        self.values
+        state = self.__dict__.copy()
+        state['loader'] = None
+        state['_index'] = None
+        state['_data'] = None
+        state['_element_index'] = None
+        state['_pair_index'] = None
+        state['_groups'] = dict()
+        return state
 
     def set_info(self, info, extinfo):
         self.name = info[1]
         self.dim = info[2]
+        self.datatype = info[3]
         self.records = extinfo[1]
         self.description = extinfo[3]
 
+    def set_records(self, keys, values, uels):
+        self._keys = keys
+        self._values = values
+        self.uels = uels
+        self.records = len(values)
+        self._index = None
+        self._data = None
+        self._element_index = None
+        self._pair_index = None
+        self._groups = dict()
+
+    def load(self):
+        if self.loader is not None:
+            self.loader(self)
+        else:
+            self.set_records(np.empty((0, self.dim), dtype=np.int32),
+                             np.empty(0), self.uels)
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            self.load()
+        return self._keys
+
+    @property
+    def values(self):
+        if self._values is None:
+            self.load()
+        return self._values
+
+    @property
+    def index(self):
+        if self._index is None:
+            keys = self.keys.tolist()
+            uels = self.uels
+            self._index = [[uels[k] for k in row] for row in keys]
+        return self._index
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.values.tolist()
+        return self._data
+
+    def get_positions(self, element):
+        """Return the positions of all records which contain ``element``
+        (e.g. a node or link name) in any dimension.
+        """
+        if self._element_index is None:
+            element_index = dict()
+            for i, idx in enumerate(self.index):
+                for name in set(idx):
+                    element_index.setdefault(name, []).append(i)
+            self._element_index = element_index
+        return self._element_index.get(element, [])
+
+    def get_pair_positions(self, from_node, to_node):
+        """Return the positions of all records which contain ``from_node``
+        and, after it, ``to_node``.
+        """
+        if self._pair_index is None:
+            pair_index = dict()
+            for i, idx in enumerate(self.index):
+                names = []
+                for name in idx:
+                    if name not in names:
+                        names.append(name)
+                for a in range(len(names)):
+                    for b in range(a + 1, len(names)):
+                        pair_index.setdefault((names[a], names[b]), []).append(i)
+            self._pair_index = pair_index
+        return self._pair_index.get((from_node, to_node), [])
+
+    def find_dimension(self, elements):
+        """Return the first dimension which holds any of ``elements`` (e.g.
+        the names of all nodes), or None.
+        """
+        for dimension in range(self.dim):
+            codes = np.unique(self.keys[:, dimension]).tolist()
+            for code in codes:
+                if self.uels[code] in elements:
+                    return dimension
+        return None
+
+    def group_by(self, dimension):
+        """Partition the records by their element in ``dimension``.
+
+        The records are sorted by this dimension once (a stable sort, so
+        records keep their order within a group). Returns a dict mapping
+        each element to the keys of its records without ``dimension`` and
+        their values; both are views of the sorted arrays.
+        """
+        if dimension not in self._groups:
+            order = np.argsort(self.keys[:, dimension], kind='mergesort')
+            column = self.keys[order, dimension]
+            other = np.delete(self.keys, dimension, axis=1)[order]
+            values = self.values[order]
+
+            starts = np.flatnonzero(np.r_[True, column[1:] != column[:-1]])
+            ends = np.r_[starts[1:], len(column)]
+            groups = dict()
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                groups[self.uels[column[start]]] = (other[start:end],
+                                                    values[start:end])
+            self._groups[dimension] = groups
+        return self._groups[dimension]
+
+    def decode(self, keys):
+        """Return an array of UEL codes as lists of element names.
+        """
+        uels = self.uels
+        return [[uels[k] for k in row] for row in keys.tolist()]
+
+
+def get_record_value(record):
+    """
+    Return the value of a record of a GamsDatabase, like the first value
+    returned by gdxDataReadStr: the level of variables and equations, the
+    value of parameters and 0 for sets.
+    """
+    if hasattr(record, 'level'):
+        return record.level
+    elif hasattr(record, 'value'):
+        return record.value
+    return 0.0
+
+
+_worker_importer = None
+
+def init_worker(importer):
+    """Initialise a worker process of ``GAMSImporter.assign_attr_data``.
+    """
+    global _worker_importer
+    _worker_importer = importer
+
+def build_resource_data(jobs):
+    """Build the resource scenarios of a chunk of jobs in a worker process.
+    """
+    res_scens = []
+    for job in jobs:
+        res_scens.extend(_worker_importer.create_resource_data(job))
+    return res_scens
+
 
 class GAMSImporter(JSONPlugin):
 
@@ -49,24 +235,38 @@ class GAMSImporter(JSONPlugin):
         self.symbol_count = 0
         self.element_count = 0
         self.gdx_variables = dict()
+        self.uels = [None]
         self.gams_units = dict()
         self.gdx_ts_vars = dict()
         self.network_id = args.network_id
         self.scenario_id = args.scenario_id
         self.network = None
+        self.scenario = None
         self.res_scenario = None
-        self.attrs = dict()
+        self.results_start = 0
+        self.attrs = None
         self.time_axis = dict()
         self.gms_data = []
+        self.gms_index = None
+        self.export_index = None
         self.connection = connection
 
 
         if self.connection is None:
             self.connect(args)
 
-        attrslist = self.connection.call('get_all_attributes', {})
-        for attr in attrslist:
-            self.attrs.update({attr.id: attr.name})
+        self.attrs = get_attribute_catalog(self.connection,
+                                           cache_file=args.attr_cache,
+                                           ttl=int(args.attr_cache_ttl))
+
+    def __getstate__(self):
+        # Only the data needed to build datasets is sent to worker processes
+        state = self.__dict__.copy()
+        for key in ('gdxcc', 'gdx_handle', 'connection', 'network',
+                    'scenario', 'res_scenario', 'gms_data', 'gms_index',
+                    'export_index', 'attrs'):
+            state[key] = None
+        return state
 
     def load_network(self, is_licensed, network_id=None, scenario_id=None):
         """
@@ -98,7 +298,8 @@ class GAMSImporter(JSONPlugin):
                                              'scenario_ids': [int(scenario_id)],
                                              'template_id': None})
 
-        self.res_scenario = self.network.scenarios[0].resourcescenarios
+        self.scenario_id = scenario_id
+        self.set_scenario()
         if(is_licensed is False):
             if len(self.network.nodes)>20:
                 raise HydraPluginError("The licence is limited demo (maximum limits are 20 nodes and 20 times steps).  Please contact software vendor (hydraplatform1@gmail.com) to get a full licence")
@@ -110,11 +311,32 @@ class GAMSImporter(JSONPlugin):
         """
         self.is_licensed=is_licensed
         self.network =network
-        self.res_scenario = self.network.scenarios[0].resourcescenarios
+        self.set_scenario()
         if(is_licensed is False):
             if len(self.network.nodes)>20:
                 raise HydraPluginError("The licence is limited demo (maximum limits are 20 nodes and 20 times steps).  Please contact software vendor (hydraplatform1@gmail.com) to get a full licence")
 
+    def set_scenario(self):
+        """
+           Select the scenario the results are saved to, the one with id
+           self.scenario_id. The network may hold the data of several
+           scenarios, e.g. when it was retrieved once for a batch of runs.
+           The results are added to a copy of its data, so the network
+           itself is not modified.
+        """
+        scenarios = self.network.scenarios or []
+        self.scenario = None
+        if self.scenario_id is not None:
+            for scenario in scenarios:
+                if scenario.id == int(self.scenario_id):
+                    self.scenario = scenario
+        elif len(scenarios) == 1:
+            self.scenario = scenarios[0]
+        if self.scenario is None:
+            raise HydraPluginError("Scenario %s not found in network %s." %
+                                   (self.scenario_id, self.network.id))
+        self.res_scenario = list(self.scenario.resourcescenarios or [])
+
 
     #####################################################
     def open_gdx_file(self, filename):
@@ -136,59 +358,208 @@ class GAMSImporter(JSONPlugin):
         log.info('Importing %s symbols and %s elements.' %
                      (self.symbol_count, self.element_count))
 
+        # Only the symbol table is read here, records and the UEL table are
+        # read when they are first needed.
+        self.uels = None
+        self.gdx_variables = dict()
+        result_names = self.get_result_names()
+        if result_names is None:
+            symbol_nrs = range(1, self.symbol_count + 1)
+        else:
+            symbol_nrs = []
+            for name in sorted(result_names):
+                rc, symbol_nr = self.gdxcc.gdxFindSymbol(self.gdx_handle, name)
+                if rc != 0:
+                    symbol_nrs.append(symbol_nr)
+
+        for symbol_nr in symbol_nrs:
+            gdx_variable = GDXvariable(loader=self.read_symbol_records)
+            info = self.gdxcc.gdxSymbolInfo(self.gdx_handle, symbol_nr)
+            extinfo = self.gdxcc.gdxSymbolInfoX(self.gdx_handle, symbol_nr)
+            gdx_variable.set_info(info, extinfo)
+            gdx_variable.symbol_nr = symbol_nr
+            self.gdx_variables.update({gdx_variable.name: gdx_variable})
+
+        log.info('Found %s of %s symbols.', len(self.gdx_variables),
+                 self.symbol_count)
+
+    def read_uels(self):
+        """Read the UEL (element) table of the GDX file, codes start at 1.
+        """
+        self.uels = [None]
+        for n in range(1, self.element_count + 1):
+            rc, uel, uel_map = self.gdxcc.gdxUMUelGet(self.gdx_handle, n)
+            self.uels.append(uel)
+
+    def get_result_names(self):
+        """Return the names of the attributes of the network which hold
+        results (attr_is_var is 'Y'), or None if no network is set.
+        """
+        if self.network is None:
+            return None
+        names = set()
+        for resource in [self.network] + self.network.nodes + self.network.links:
+            for attr in resource.attributes:
+                if attr.attr_is_var == 'Y':
+                    names.add(self.attrs.get_name(attr.attr_id))
+        return names
+
     def read_gdx_data(self):
-        """Read variables and data from GDX file.
+        """Read the records of all symbols found by open_gdx_file now,
+        rather than when they are first used.
         """
-        print ""
-        for i in range(self.symbol_count):
-            gdx_variable = GDXvariable()
+        for gdx_variable in self.gdx_variables.values():
+            gdx_variable.load()
+
+    def read_symbol_records(self, gdx_variable):
+        """Read the records of a symbol as UEL codes and values.
+        """
+        if self.uels is None:
+            self.read_uels()
+        log.info('Reading %s records of %s.', gdx_variable.records,
+                 gdx_variable.name)
+        rc, n_records = self.gdxcc.gdxDataReadRawStart(self.gdx_handle,
+                                                        gdx_variable.symbol_nr)
+        dim = gdx_variable.dim
+        keys = np.empty((n_records, dim), dtype=np.int32)
+        values = np.empty(n_records)
+        level = self.gdxcc.GMS_VAL_LEVEL
+        for n in range(n_records):
+            rc, idx, data, dim_first = self.gdxcc.gdxDataReadRaw(self.gdx_handle)
+            keys[n] = idx[:dim]
+            values[n] = data[level]
+        self.gdxcc.gdxDataReadDone(self.gdx_handle)
 
-            info = self.gdxcc.gdxSymbolInfo(self.gdx_handle, i + 1)
-            extinfo = self.gdxcc.gdxSymbolInfoX(self.gdx_handle, i + 1)
+        gdx_variable.set_records(keys, values, self.uels)
 
-            gdx_variable.set_info(info, extinfo)
+    def read_database(self, database):
+        """Read variables and data from a GamsDatabase, e.g. the out_db of
+        the GAMS job, instead of a GDX file.
+        """
+        result_names = self.get_result_names()
+        if self.uels is None:
+            self.uels = [None]
+        uel_codes = dict((uel, n) for n, uel in enumerate(self.uels) if n > 0)
+        for symbol in database:
+            if result_names is not None and symbol.name not in result_names:
+                continue
 
-            self.gdxcc.gdxDataReadStrStart(self.gdx_handle, i + 1)
+            gdx_variable = GDXvariable()
+            gdx_variable.name = symbol.name
+            gdx_variable.dim = symbol.dimension
+            gdx_variable.description = symbol.text
 
-            for n in range(gdx_variable.records):
-                x, idx, data, y = self.gdxcc.gdxDataReadStr(self.gdx_handle)
-                gdx_variable.index.append(idx)
-                gdx_variable.data.append(data[0])
+            keys = np.empty((symbol.number_records, symbol.dimension), dtype=np.int32)
+            values = np.empty(symbol.number_records)
+            for n, record in enumerate(symbol):
+                for d, uel in enumerate(record.keys):
+                    code = uel_codes.get(uel)
+                    if code is None:
+                        code = len(self.uels)
+                        self.uels.append(uel)
+                        uel_codes[uel] = code
+                    keys[n, d] = code
+                values[n] = get_record_value(record)
+            gdx_variable.set_records(keys, values, self.uels)
             self.gdx_variables.update({gdx_variable.name: gdx_variable})
-            #print "name ====>", gdx_variable.name
-            #print "index====>", gdx_variable.index
-            #print "data ====>", gdx_variable,data
 
-    def load_gams_file(self, gms_file):
-        """Read in the .gms file.
+        log.info('Imported %s symbols from the GAMS database.',
+                 len(self.gdx_variables))
+
+    def load_gams_file(self, gms_file, skip_includes=None):
+        """Read in the .gms file. Included files matching the glob pattern
+        ``skip_includes`` are not read, except for their header and time
+        index.
         """
         if gms_file is None:
             raise HydraPluginError(".gms file not specified.")
         gms_file = os.path.abspath(gms_file)
 
-        gms_data = import_gms_data(gms_file)
-
-        self.gms_data = gms_data.split('\n')
+        self.gms_data, files = read_gms_lines(gms_file, skip_includes)
+        self.gms_index = None
+        self.load_index_file(files[1:])
 
         if self.network_id is None or self.scenario_id is None:
             self.network_id, self.scenario_id = self.get_ids_from_gms()
 
+    def load_index_file(self, included_files):
+        """Load the index file the exporter writes next to the data file
+        (see ``GAMSExporter.write_index_file``), if one of the files
+        included by the model has an index which is not older than the file
+        itself.
+        """
+        self.export_index = None
+        for filename in included_files:
+            index_file = get_index_file_name(filename)
+            if not os.path.exists(index_file):
+                continue
+            if os.path.getmtime(index_file) < os.path.getmtime(filename):
+                log.info("Ignoring outdated index %s", index_file)
+                continue
+            try:
+                with open(index_file) as f:
+                    self.export_index = json.load(f)
+            except ValueError as e:
+                log.warning("Could not read index %s: %s", index_file, e)
+                continue
+            log.info("Index of the exported data read from %s", index_file)
+            break
+
+    def index_gms_data(self):
+        """Index the .gms file in a single pass: the first line of each
+        declaration block (by its lower case keyword, e.g. 'positive
+        variables'), the timestamp parameter and the Network-ID and
+        Scenario-ID lines written by the exporter.
+        """
+        index = dict(declarations=dict(),
+                     timestamp=None,
+                     network_id=None,
+                     scenario_id=None)
+        declarations = index['declarations']
+        for i, line in enumerate(self.gms_data):
+            sline = line.strip()
+            keyword = sline.lower()
+            if declaration_re.match(keyword) is not None:
+                if keyword not in declarations:
+                    declarations[keyword] = i
+            elif index['timestamp'] is None and \
+                    sline.startswith('Parameter timestamp('):
+                if sline.startswith('Parameter timestamp(yr, mn, dy)'):
+                    index['timestamp'] = ('date', i)
+                elif sline.startswith('Parameter timestamp(t)'):
+                    index['timestamp'] = ('t_index', i)
+            if index['network_id'] is None and 'Network-ID' in line:
+                index['network_id'] = i
+            if index['scenario_id'] is None and 'Scenario-ID' in line:
+                index['scenario_id'] = i
+        self.gms_index = index
+
+    def get_gms_index(self):
+        """Return the index of the .gms file, see ``index_gms_data``.
+        """
+        if self.gms_index is None:
+            self.index_gms_data()
+        return self.gms_index
+
     def get_ids_from_gms(self):
         """Read the network and scenario ids from the GMS file. This function
         should be called when the user doesn't supply a network and/or a
         scenario id.
         """
+        if self.export_index is not None:
+            return self.export_index['network_id'], \
+                self.export_index['scenario_id']
+
         # Get the very first line containing 'Network-ID' and 'Scenario-ID'
-        networkline = next((x for x in self.gms_data if 'Network-ID' in x),
-                           None)
-        scenarioline = next((x for x in self.gms_data if 'Scenario-ID' in x),
-                            None)
-        if networkline is not None:
+        gms_index = self.get_gms_index()
+        if gms_index['network_id'] is not None:
+            networkline = self.gms_data[gms_index['network_id']]
             network_id = int(networkline.split(':')[1])
         else:
             network_id = None
 
-        if scenarioline is not None:
+        if gms_index['scenario_id'] is not None:
+            scenarioline = self.gms_data[gms_index['scenario_id']]
             scenario_id = int(scenarioline.split(':')[1])
         else:
             scenario_id = None
@@ -198,19 +569,27 @@ class GAMSImporter(JSONPlugin):
     def parse_time_index(self):
         """
         Read the time index of the GAMS model used. This only works for
-        models where data is exported from Hydra using GAMSexport.
+        models where data is exported from Hydra using GAMSexport. The
+        index file of the exported data is used if there is one, otherwise
+        the timestamp parameter is parsed from the .gms file.
         """
         time_index_type=None
-        for i, line in enumerate(self.gms_data):
-            #if line[0:24] == 'Parameter timestamp(t) ;':
-             #  break
-            if line.strip().startswith('Parameter timestamp(yr, mn, dy)'):
-                time_index_type='date'
-                break
-            elif line.strip().startswith('Parameter timestamp(t)'):
-                time_index_type='t_index'
-                break
-        if time_index_type is "t_index":
+        if self.export_index is not None:
+            time_index_type = 'index'
+        else:
+            timestamp_block = self.get_gms_index()['timestamp']
+            if timestamp_block is not None:
+                time_index_type, i = timestamp_block
+        if time_index_type == 'index':
+            use_gams_date_index = self.export_index['use_gams_date_index']
+            for t, ordinal in self.export_index['time_axis']:
+                timestamp = ordinal_to_timestamp(Decimal(ordinal))
+                if use_gams_date_index is True:
+                    idx=str(timestamp.year)+"."+str(timestamp.month)+"."+str(timestamp.day)
+                else:
+                    idx = t
+                self.time_axis.update({idx: date_to_string(timestamp)})
+        elif time_index_type is "t_index":
             i += 2
             line = self.gms_data[i]
             while line.split('(', 1)[0].strip() == 'timestamp':
@@ -237,13 +616,31 @@ class GAMSImporter(JSONPlugin):
             if len(self.time_axis)>20:
                 raise HydraPluginError("The licence is limited demo (maximum limits are 20 nodes and 20 times steps).  Please contact software vendor (hydraplatform1@gmail.com) to get a full licence")
 
+    def set_time_axis(self, time_index, use_gams_date_index=False):
+        """
+        Set the time index from the time axis used by the exporter. This is
+        needed for models which read their input from a gdx file, so that
+        the time index can't be read from the .gms file.
+        """
+        for t, date in enumerate(time_index):
+            timestamp = ordinal_to_timestamp(Decimal(convert_date_to_timeindex(date)))
+            if use_gams_date_index is True:
+                idx=str(timestamp.year)+"."+str(timestamp.month)+"."+str(timestamp.day)
+            else:
+                idx = t
+            self.time_axis.update({idx: date_to_string(timestamp)})
+
+        if(self.is_licensed is False):
+            if len(self.time_axis)>20:
+                raise HydraPluginError("The licence is limited demo (maximum limits are 20 nodes and 20 times steps).  Please contact software vendor (hydraplatform1@gmail.com) to get a full licence")
+
     def parse_variables(self, variable):
         """For all variables stored in the gdx file, check if these are time
         time series or not.
         """
-        for i, line in enumerate(self.gms_data):
-            if line.strip().lower() == variable:
-                break
+        i = self.get_gms_index()['declarations'].get(variable)
+        if i is None:
+            return
 
         i += 1
         if(i>=len(self.gms_data)):
@@ -276,199 +673,261 @@ class GAMSImporter(JSONPlugin):
             i += 1
             line = self.gms_data[i]
 
-    def assign_attr_data(self):
+    def get_result_jobs(self):
+        """Return one job per resource with result attributes, in the order
+        network, nodes, links. A job is a plain tuple (resource type, name,
+        from node, to node, attributes), where attributes is a list of
+        (resource attribute id, attribute id, variable name, dimension), so
+        jobs can be sent to worker processes.
+        """
+        def get_attrs(resource):
+            attrs = []
+            for attr in resource.attributes:
+                if attr.attr_is_var == 'Y':
+                    if self.attrs.get_name(attr.attr_id) in self.gdx_variables.keys():
+                        try:
+                            dimension = attr.resourcescenario.value.dimension
+                        except AttributeError:
+                            dimension = None
+                        attrs.append((attr.id, attr.attr_id,
+                                      self.attrs.get_name(attr.attr_id), dimension))
+            return attrs
+
+        jobs = []
+        nodes = dict()
+        attrs = get_attrs(self.network)
+        if len(attrs) > 0:
+            jobs.append(('NETWORK', None, None, None, attrs))
+        for node in self.network.nodes:
+            nodes.update({node.id: node.name})
+            attrs = get_attrs(node)
+            if len(attrs) > 0:
+                jobs.append(('NODE', node.name, None, None, attrs))
+        for link in self.network.links:
+            attrs = get_attrs(link)
+            if len(attrs) > 0:
+                jobs.append(('LINK', link.name, nodes[link.node_1_id],
+                             nodes[link.node_2_id], attrs))
+        return jobs
+
+    def assign_attr_data(self, workers=None):
         """Assign data to all variable attributes in the network.
+
+        If ``workers`` is greater than 1, the datasets are built by a pool
+        of worker processes, each handling chunks of resources. The results
+        are merged in the same order as in a serial run.
         """
-        # Network attributes
-        for attr in self.network.attributes:
-            if attr.attr_is_var == 'Y':
-                if self.attrs[attr.attr_id] in self.gdx_variables.keys():
-                    gdxvar = self.gdx_variables[self.attrs[attr.attr_id]]
-                    dataset = dict(name='GAMS import - ' + gdxvar.name,)
-                    if(gdxvar.name in self.gams_units):
-                            dataset['unit'] = self.gams_units[gdxvar.name]
-                    else:
-                        dataset['unit'] ='-'
-
-                    if gdxvar.name in self.gdx_ts_vars.keys():
-                        dataset['type'] = 'timeseries'
-                        index = []
-                        count=0;
-                        for idx in gdxvar.index:
-                            if len(idx) is 1:
-                                index.append(idx[self.gdx_ts_vars[gdxvar.name]])
-                            elif len(idx) is 3:
-                                 index.append('.'.join(map(str,idx)))
-                        data = gdxvar.data
-                        dataset['value'] = self.create_timeseries(index, data)
-                    elif gdxvar.dim == 0:
-                        data = gdxvar.data[0]
+        # Array results are split by the dimension holding the node names
+        self.node_names = set(node.name for node in self.network.nodes)
+        self.node_dims = dict()
+        self.results_start = len(self.res_scenario)
+        jobs = self.get_result_jobs()
+
+        if workers is None or workers < 2 or len(jobs) < 2:
+            for job in jobs:
+                self.res_scenario.extend(self.create_resource_data(job))
+            return
+
+        # Read all records here, so workers don't need the gdx file
+        used = set(attr[2] for job in jobs for attr in job[4])
+        for name in used:
+            gdxvar = self.gdx_variables[name]
+            gdxvar.keys
+            gdxvar.values
+            if gdxvar.dim > 1:
+                self.node_dims[name] = gdxvar.find_dimension(self.node_names)
+
+        # Workers are sent a copy of the importer (on Windows, where they
+        # are spawned, it is pickled), which only holds the variables used
+        # by the jobs. Pickling a variable reads its records.
+        worker_importer = copy.copy(self)
+        worker_importer.gdx_variables = dict(
+            (name, self.gdx_variables[name]) for name in used)
+
+        chunksize = max(1, len(jobs) // (workers * 4))
+        chunks = [jobs[i:i + chunksize] for i in range(0, len(jobs), chunksize)]
+        log.info("Building datasets for %s resources with %s workers",
+                 len(jobs), workers)
+        pool = multiprocessing.Pool(workers, initializer=init_worker,
+                                    initargs=(worker_importer,))
+        try:
+            results = pool.map(build_resource_data, chunks)
+        finally:
+            pool.close()
+            pool.join()
+        for res_scens in results:
+            self.res_scenario.extend(res_scens)
+
+    def create_resource_data(self, job):
+        """Build the resource scenarios of one job returned by
+        ``get_result_jobs``.
+        """
+        ref_key, name, fromnode, tonode, attrs = job
+        res_scens = []
+        for attr_id_, attr_id, var_name, dimension in attrs:
+            gdxvar = self.gdx_variables[var_name]
+            if ref_key == 'NETWORK':
+                dataset = self.create_network_dataset(gdxvar)
+            elif ref_key == 'NODE':
+                dataset = self.create_node_dataset(name, gdxvar)
+            else:
+                dataset = self.create_link_dataset(name, fromnode, tonode,
+                                                   gdxvar)
+            # Add data
+            if dataset is not None and dataset.has_key('value'):
+                metadata={}
+                dataset['metadata']=json.dumps(metadata)
+                dataset['dimension']=dimension
+                res_scen = dict(resource_attr_id = attr_id_,
+                                attr_id = attr_id,
+                                value = dataset)
+                res_scens.append(res_scen)
+        return res_scens
+
+    def create_network_dataset(self, gdxvar):
+        dataset = dict(name='GAMS import - ' + gdxvar.name,)
+        if(gdxvar.name in self.gams_units):
+                dataset['unit'] = self.gams_units[gdxvar.name]
+        else:
+            dataset['unit'] ='-'
+
+        if gdxvar.name in self.gdx_ts_vars.keys():
+            dataset['type'] = 'timeseries'
+            index = []
+            count=0;
+            for idx in gdxvar.index:
+                if len(idx) is 1:
+                    index.append(idx[self.gdx_ts_vars[gdxvar.name]])
+                elif len(idx) is 3:
+                     index.append('.'.join(map(str,idx)))
+            data = gdxvar.data
+            dataset['value'] = self.create_timeseries(index, data)
+        elif gdxvar.dim == 0:
+            data = gdxvar.data[0]
+            try:
+                data_ = float(data)
+                dataset['type'] = 'scalar'
+                dataset['value'] = json.dumps(data)
+            except ValueError:
+                dataset['type'] = 'descriptor'
+                dataset['value'] = data
+        elif gdxvar.dim > 0:
+            return None
+            dataset['type'] = 'array'
+            dataset['value'] = self.create_array(gdxvar.index,
+                                              gdxvar.data)
+        return dataset
+
+    def create_node_dataset(self, node_name, gdxvar):
+        dataset = dict(name = 'GAMS import - ' + node_name + ' ' \
+            + gdxvar.name)
+        if(gdxvar.name in self.gams_units):
+            dataset['unit'] = self.gams_units[gdxvar.name]
+        else:
+            dataset['unit'] ='-'
+        if gdxvar.name in self.gdx_ts_vars.keys():
+            dataset['type'] = 'timeseries'
+            index = []
+            data = []
+            for i in gdxvar.get_positions(node_name):
+                idx = gdxvar.index[i]
+                if len(idx) is 4:
+                    index.append('.'.join(map(str,idx[1:])))
+                elif len(idx) is 2:
+                    index.append(idx[self.gdx_ts_vars[gdxvar.name]])
+                data.append(gdxvar.data[i])
+            dataset['value'] = self.create_timeseries(index, data)
+        elif gdxvar.dim == 1:
+            for i in gdxvar.get_positions(node_name):
+                data = gdxvar.data[i]
+                try:
+                    data_ = float(data)
+                    dataset['type'] = 'scalar'
+                    dataset['value'] = json.dumps(data)
+                except ValueError:
+                    dataset['type'] = 'descriptor'
+                    dataset['value'] = data
+                break
+
+        elif gdxvar.dim > 1:
+            dataset['type'] = 'array'
+            index = []
+            data = []
+            if gdxvar.name not in self.node_dims:
+                self.node_dims[gdxvar.name] = gdxvar.find_dimension(self.node_names)
+            node_dim = self.node_dims[gdxvar.name]
+            if node_dim is not None:
+                groups = gdxvar.group_by(node_dim)
+                if node_name in groups:
+                    keys, values = groups[node_name]
+                    index = gdxvar.decode(keys)
+                    data = values.tolist()
+
+            dataset['value'] = self.create_array(index, data)
+        return dataset
+
+    def create_link_dataset(self, link_name, fromnode, tonode, gdxvar):
+        dataset = dict(name = 'GAMS import - ' + link_name + ' ' \
+            + gdxvar.name,
+                      locked='N')
+        if(gdxvar.name in self.gams_units):
+            dataset['unit'] = self.gams_units[gdxvar.name]
+        else:
+            dataset['unit'] ='-'
+        if gdxvar.name in self.gdx_ts_vars.keys():
+            dataset['type'] = 'timeseries'
+            index = []
+            data = []
+            for i in gdxvar.get_pair_positions(fromnode, tonode):
+                idx = gdxvar.index[i]
+                if len (idx) is 5:
+                    index.append('.'.join(map(str,idx[2:])))
+                elif len (idx) is 3:
+                    index.append(idx[self.gdx_ts_vars[gdxvar.name]])
+                data.append(gdxvar.data[i])
+            dataset['value'] = self.create_timeseries(index, data)
+        elif gdxvar.dim == 2:
+            for i in gdxvar.get_pair_positions(fromnode, tonode):
+                data = gdxvar.data[i]
+                try:
+                    data_ = float(data)
+                    dataset['type'] = 'scalar'
+                    dataset['value'] = json.dumps(data)
+                except ValueError:
+                    dataset['type'] = 'descriptor'
+                    dataset['value'] = json.dumps(data)
+                break
+        elif gdxvar.dim > 2:
+            is_in=False
+            if gdxvar.dim  == 3:
+                for i in gdxvar.get_positions(link_name):
+                    idx = gdxvar.index[i]
+                    if idx[0] == link_name and fromnode in idx and tonode in idx:
+                        data = gdxvar.data[i]
                         try:
                             data_ = float(data)
                             dataset['type'] = 'scalar'
                             dataset['value'] = json.dumps(data)
                         except ValueError:
                             dataset['type'] = 'descriptor'
-                            dataset['value'] = data
-                    elif gdxvar.dim > 0:
-                        continue
-                        dataset['type'] = 'array'
-                        dataset['value'] = self.create_array(gdxvar.index,
-                                                          gdxvar.data)
-                    # Add data
-                    if dataset.has_key('value'):
-                        metadata={}
-                        dataset['metadata']=json.dumps(metadata)
-                        dataset['dimension']=attr.resourcescenario.value.dimension
-                        res_scen = dict(resource_attr_id = attr.id,
-                                        attr_id = attr.attr_id,
-                                        value = dataset)
-                        self.res_scenario.append(res_scen)
-        # Node attributes
-        nodes = dict()
-        for node in self.network.nodes:
-            nodes.update({node.id: node.name})
-            for attr in node.attributes:
-                if attr.attr_is_var == 'Y':
-                    if self.attrs[attr.attr_id] in self.gdx_variables.keys():
-                        gdxvar = self.gdx_variables[self.attrs[attr.attr_id]]
-                        dataset = dict(name = 'GAMS import - ' + node.name + ' ' \
-                            + gdxvar.name)
-                        if(gdxvar.name in self.gams_units):
-                            dataset['unit'] = self.gams_units[gdxvar.name]
-                        else:
-                            dataset['unit'] ='-'
-                        if gdxvar.name in self.gdx_ts_vars.keys():
-                            dataset['type'] = 'timeseries'
-                            index = []
-                            data = []
-                            for i, idx in enumerate(gdxvar.index):
-                                if node.name in idx:
-                                    if len(idx) is 4:
-                                        index.append('.'.join(map(str,idx[1:])))
-                                    elif len(idx) is 2:
-                                        index.append(idx[self.gdx_ts_vars[gdxvar.name]])
-                                    data.append(gdxvar.data[i])
-                            dataset['value'] = self.create_timeseries(index, data)
-                        elif gdxvar.dim == 1:
-                            for i, idx in enumerate(gdxvar.index):
-                                #print idx
-                                if node.name in idx:
-                                    data = gdxvar.data[i]
-                                    try:
-                                        data_ = float(data)
-                                        dataset['type'] = 'scalar'
-                                        dataset['value'] = json.dumps(data)
-                                    except ValueError:
-                                        dataset['type'] = 'descriptor'
-                                        dataset['value'] = data
-                                    break
-
-                        elif gdxvar.dim > 1:
-                            dataset['type'] = 'array'
-                            index = []
-                            data = []
-                            inx=copy.deepcopy(gdxvar.index)
-                            dat=copy.deepcopy(gdxvar.data)
-                            for i, idx in enumerate(inx):
-                                if node.name in idx:
-                                    idx.pop(idx.index(node.name))
-                                    index.append(idx)
-                                    data.append(dat[i])
-                            #print "index: ",index
-
-                            #self.arrange_array(gdxvar.index, gdxvar.data)
-                            dataset['value'] = self.create_array(inx,
-                                                              dat)
-
-                        metadata={}
-                        if dataset.has_key('value'):
-                            dataset['metadata']=json.dumps(metadata)
-                            dataset['dimension']=attr.resourcescenario.value.dimension
-
-                            res_scen = dict(resource_attr_id = attr.id,
-                                            attr_id = attr.attr_id,
-                                            value = dataset)
-                            self.res_scenario.append(res_scen)
-
-        # Link attributes
-        for link in self.network.links:
-            for attr in link.attributes:
-                if attr.attr_is_var == 'Y':
-                    fromnode = nodes[link.node_1_id]
-                    tonode = nodes[link.node_2_id]
-                    if self.attrs[attr.attr_id] in self.gdx_variables.keys():
-                        gdxvar = self.gdx_variables[self.attrs[attr.attr_id]]
-                        dataset = dict(name = 'GAMS import - ' + link.name + ' ' \
-                            + gdxvar.name,
-                                      locked='N')
-                        if(gdxvar.name in self.gams_units):
-                            dataset['unit'] = self.gams_units[gdxvar.name]
-                        else:
-                            dataset['unit'] ='-'
-                        if gdxvar.name in self.gdx_ts_vars.keys():
-                            dataset['type'] = 'timeseries'
-                            index = []
-                            data = []
-                            for i, idx in enumerate(gdxvar.index):
-                                if fromnode in idx and tonode in idx and \
-                                   idx.index(fromnode) < idx.index(tonode):
-                                    if len (idx) is 5:
-                                        index.append('.'.join(map(str,idx[2:])))
-                                    elif len (idx) is 3:
-                                        index.append(idx[self.gdx_ts_vars[gdxvar.name]])
-                                    data.append(gdxvar.data[i])
-                            dataset['value'] = self.create_timeseries(index, data)
-                        elif gdxvar.dim == 2:
-                            for i, idx in enumerate(gdxvar.index):
-                                if fromnode in idx and tonode in idx and \
-                                   idx.index(fromnode) < idx.index(tonode):
-                                    data = gdxvar.data[i]
-                                    try:
-                                        data_ = float(data)
-                                        dataset['type'] = 'scalar'
-                                        dataset['value'] = json.dumps(data)
-                                    except ValueError:
-                                        dataset['type'] = 'descriptor'
-                                        dataset['value'] = json.dumps(data)
-                                    break
-                        elif gdxvar.dim > 2:
-                            is_in=False
-                            if gdxvar.dim  == 3:
-                                for i, idx in enumerate(gdxvar.index):
-                                    if idx[0] == link.name and fromnode in idx and tonode in idx:
-                                        data = gdxvar.data[i]
-                                        try:
-                                            data_ = float(data)
-                                            dataset['type'] = 'scalar'
-                                            dataset['value'] = json.dumps(data)
-                                        except ValueError:
-                                            dataset['type'] = 'descriptor'
-                                            dataset['value'] = json.dumps(data)
-                                        is_in=True
-                                        break
-                            if is_in is False:
-                                continue
-                                dataset['type'] = 'array'
-                                index = []
-                                data = []
-                                for i, idx in enumerate(gdxvar.index):
-                                    if fromnode in idx and tonode in idx and \
-                                       idx.index(fromnode) < idx.index(tonode):
-                                        idx.pop(idx.index(fromnode))
-                                        idx.pop(idx.index(tonode))
-                                        index.append(idx)
-                                        data.append(gdxvar.data[i])
-                                dataset['value'] = self.create_array(gdxvar.index,
-                                                                 gdxvar.data)
-                        if dataset.has_key('value'):
-                            metadata={}
-                            dataset['metadata']=json.dumps(metadata)
-                            dataset['dimension']=attr.resourcescenario.value.dimension
-                            res_scen = dict(resource_attr_id = attr.id,
-                                            attr_id = attr.attr_id,
-                                            value = dataset)
-                            self.res_scenario.append(res_scen)
+                            dataset['value'] = json.dumps(data)
+                        is_in=True
+                        break
+            if is_in is False:
+                return None
+                dataset['type'] = 'array'
+                index = []
+                data = []
+                for i, idx in enumerate(gdxvar.index):
+                    if fromnode in idx and tonode in idx and \
+                       idx.index(fromnode) < idx.index(tonode):
+                        idx.pop(idx.index(fromnode))
+                        idx.pop(idx.index(tonode))
+                        index.append(idx)
+                        data.append(gdxvar.data[i])
+                dataset['value'] = self.create_array(gdxvar.index,
+                                                 gdxvar.data)
+        return dataset
 
     def create_array(self, index, data):
         elements={}
@@ -487,14 +946,15 @@ class GAMSImporter(JSONPlugin):
         return json.dumps(values)
 
     def create_timeseries(self, index, data):
-        timeseries = {'0': {}}
-        for i, idx in enumerate(index):
-             if idx.find(".") is -1:
-                 timeseries['0'][self.time_axis[int(idx)]] = json.dumps(data[i])
-             else:
-                 timeseries['0'][self.time_axis[idx]] = json.dumps(data[i])
-
-        return json.dumps(timeseries)
+        """Return the JSON value of a time series. Time steps are looked up
+        in ``self.time_axis``; values are written as numbers and the series
+        is encoded only once.
+        """
+        time_axis = self.time_axis
+        timestamps = [time_axis[int(idx)] if idx.find(".") == -1
+                      else time_axis[idx] for idx in index]
+        values = [float(value) for value in data]
+        return json.dumps({'0': dict(zip(timestamps, values))})
 
     def create_array_(self, index, data):
         dimension = len(index[0])
@@ -533,9 +993,96 @@ class GAMSImporter(JSONPlugin):
 
         return hydra_array
 
-    def save(self):
-        self.network.scenarios[0].resourcescenarios = self.res_scenario
-        self.connection.call('update_scenario', {'scen':self.network.scenarios[0]})
+    def save(self, batch_size=None, batch_bytes=None, retries=2):
+        """Save the results to the scenario.
+
+        By default the whole scenario is sent in one update_scenario call.
+        If ``batch_size`` (number of datasets) or ``batch_bytes`` (size of
+        the JSON encoded datasets) is given, only the results are sent,
+        with update_resourcedata, in batches bounded by these limits. If a
+        batch fails, its datasets are sent one by one, each up to
+        ``retries`` more times.
+        """
+        if batch_size is None and batch_bytes is None:
+            resourcescenarios = self.scenario.resourcescenarios
+            self.scenario.resourcescenarios = self.res_scenario
+            try:
+                self.connection.call('update_scenario', {'scen':self.scenario})
+            finally:
+                self.scenario.resourcescenarios = resourcescenarios
+            return
+
+        scenario_id = self.scenario.id
+        results = self.res_scenario[self.results_start:]
+        failed = []
+        sent = 0
+        sent_bytes = 0
+        t0 = time.time()
+        for batch, nbytes in self.get_batches(results, batch_size, batch_bytes):
+            try:
+                self.update_resourcedata(scenario_id, batch)
+            except Exception as e:
+                log.warning("Saving a batch of %s datasets failed (%s). "
+                            "Retrying them one by one.", len(batch), e)
+                for res_scen in batch:
+                    if self.retry_resourcedata(scenario_id, res_scen, retries):
+                        sent += 1
+                        sent_bytes += len(json.dumps(res_scen))
+                    else:
+                        failed.append(res_scen)
+            else:
+                sent += len(batch)
+                sent_bytes += nbytes
+            elapsed = time.time() - t0
+            log.info("Saved %s of %s datasets (%.1f kB) in %.1f s, "
+                     "%.1f datasets/s", sent, len(results),
+                     sent_bytes / 1024., elapsed,
+                     sent / elapsed if elapsed > 0 else 0)
+
+        if len(failed) > 0:
+            raise HydraPluginError("Could not save %s datasets: %s" %
+                                   (len(failed), ', '.join(
+                                       res_scen['value']['name']
+                                       for res_scen in failed)))
+
+    def get_batches(self, res_scens, batch_size=None, batch_bytes=None):
+        """Split resource scenarios into batches holding at most
+        ``batch_size`` datasets and, unless a single dataset is larger,
+        ``batch_bytes`` bytes of JSON. Yields (batch, size in bytes).
+        """
+        batch = []
+        nbytes = 0
+        for res_scen in res_scens:
+            size = len(json.dumps(res_scen))
+            if len(batch) > 0 and \
+               ((batch_size is not None and len(batch) >= batch_size) or
+                (batch_bytes is not None and nbytes + size > batch_bytes)):
+                yield batch, nbytes
+                batch = []
+                nbytes = 0
+            batch.append(res_scen)
+            nbytes += size
+        if len(batch) > 0:
+            yield batch, nbytes
+
+    def update_resourcedata(self, scenario_id, res_scens):
+        self.connection.call('update_resourcedata',
+                             {'scenario_id': scenario_id,
+                              'resource_scenarios': res_scens})
+
+    def retry_resourcedata(self, scenario_id, res_scen, retries):
+        """Send a single resource scenario, trying up to ``retries`` more
+        times if it fails. Returns True if it was saved.
+        """
+        for attempt in range(retries + 1):
+            try:
+                self.update_resourcedata(scenario_id, [res_scen])
+                return True
+            except Exception as e:
+                log.warning("Saving %s failed (attempt %s of %s): %s",
+                            res_scen['value']['name'], attempt + 1,
+                            retries + 1, e)
+        return False
 
 def set_gams_path_old():
     gams_path=get_gams_path()
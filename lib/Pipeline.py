@@ -0,0 +1,93 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+A staged pipeline running in threads.
+
+Items pass through a sequence of stages, e.g. fetching a network, exporting
+it, solving the model and importing the results. Every stage has its own
+threads, so while one item is solved the next one can already be fetched
+and the previous one imported. The queues between stages are bounded: when
+a stage falls behind, the stages before it wait instead of piling up work
+(and memory).
+
+Stages waiting for the server or for GAMS don't hold the interpreter lock,
+so threads are enough for them to overlap.
+"""
+
+import Queue
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+_done = object()
+
+
+class Stage(object):
+    """
+    A stage of a pipeline: ``function`` is called with each item, by
+    ``workers`` threads at the same time.
+    """
+
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+
+
+class Pipeline(object):
+
+    def __init__(self, stages, queue_size=1):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def _work(self, stage, queue_in, queue_out):
+        while True:
+            item = queue_in.get()
+            if item is _done:
+                return
+            try:
+                stage.function(item)
+            except Exception as e:
+                log.exception(e)
+                with self.lock:
+                    self.errors.append((item, stage.name, e))
+                continue
+            if queue_out is not None:
+                queue_out.put(item)
+
+    def run(self, items):
+        """
+        Pass ``items`` through all stages. An item which fails in a stage
+        is not passed to the following stages. Returns a list of (item,
+        stage name, exception) of the failed items.
+        """
+        queues = [Queue.Queue(self.queue_size) for stage in self.stages]
+        threads = []
+        for i, stage in enumerate(self.stages):
+            queue_out = queues[i + 1] if i + 1 < len(queues) else None
+            stage_threads = []
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._work,
+                                          name='%s-%s' % (stage.name, n),
+                                          args=(stage, queues[i], queue_out))
+                thread.daemon = True
+                thread.start()
+                stage_threads.append(thread)
+            threads.append(stage_threads)
+
+        for item in items:
+            # Blocks while the first stage is busy
+            queues[0].put(item)
+
+        # Each stage is stopped once all items have left the stage before
+        for queue, stage_threads in zip(queues, threads):
+            for thread in stage_threads:
+                queue.put(_done)
+            for thread in stage_threads:
+                # Joining with a timeout keeps Ctrl-C working
+                while thread.is_alive():
+                    thread.join(0.5)
+        return self.errors
@@ -0,0 +1,157 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+Output sinks used by the GAMS exporter.
+
+Each section of the export is written to a sink as soon as it has been
+generated, so only one section needs to be held in memory at a time and the
+output file grows on disk while the export is still running.
+"""
+
+import gzip
+import logging
+import subprocess
+from cStringIO import StringIO
+
+from hydra_base.exceptions import HydraPluginError
+
+log = logging.getLogger(__name__)
+
+
+class OutputSink(object):
+    """
+    Base class for all sinks. Sub-classes provide ``_open`` which returns a
+    file-like object. The target is only opened on the first write, so that
+    an export which fails before producing any output does not leave an empty
+    file behind.
+    """
+
+    def __init__(self):
+        self.stream = None
+        self.bytes_written = 0
+
+    def _open(self):
+        raise NotImplementedError
+
+    def write(self, text):
+        if self.stream is None:
+            self.stream = self._open()
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        self.stream.write(text)
+        self.bytes_written += len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        if self.stream is not None:
+            self.stream.flush()
+
+    def close(self):
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.close()
+        log.info("%s bytes written to %s", self.bytes_written, self)
+
+
+class FileSink(OutputSink):
+    """Write the output to a plain text file."""
+
+    def __init__(self, filename):
+        super(FileSink, self).__init__()
+        self.filename = filename
+
+    def _open(self):
+        return open(self.filename, 'w')
+
+    def __str__(self):
+        return self.filename
+
+
+class GzipSink(OutputSink):
+    """Write the output to a gzip compressed file."""
+
+    def __init__(self, filename, compresslevel=6):
+        super(GzipSink, self).__init__()
+        self.filename = filename
+        self.compresslevel = compresslevel
+
+    def _open(self):
+        return gzip.open(self.filename, 'wb', self.compresslevel)
+
+    def __str__(self):
+        return self.filename
+
+
+class MemorySink(OutputSink):
+    """
+    Keep the output in memory. The text is still available after the sink
+    has been closed using ``getvalue``.
+    """
+
+    def __init__(self):
+        super(MemorySink, self).__init__()
+        self.value = None
+
+    def _open(self):
+        return StringIO()
+
+    def getvalue(self):
+        if self.stream is None:
+            return self.value or ''
+        return self.stream.getvalue()
+
+    def close(self):
+        self.value = self.getvalue()
+        super(MemorySink, self).close()
+        self.stream = None
+
+    def __str__(self):
+        return 'memory'
+
+
+class PipeSink(OutputSink):
+    """
+    Feed the output to the standard input of another process, e.g. a
+    compressor or a remote copy command.
+    """
+
+    def __init__(self, command):
+        super(PipeSink, self).__init__()
+        self.command = command
+        self.process = None
+
+    def _open(self):
+        self.process = subprocess.Popen(self.command,
+                                        stdin=subprocess.PIPE,
+                                        shell=isinstance(self.command, basestring))
+        return self.process.stdin
+
+    def close(self):
+        super(PipeSink, self).close()
+        rc = self.process.wait()
+        if rc != 0:
+            raise HydraPluginError("Output command %s failed with exit code %s"
+                                   % (self.command, rc))
+
+    def __str__(self):
+        return str(self.command)
+
+
+def create_sink(filename):
+    """
+    Create a sink for an output file name:
+
+        - ``|command`` pipes the output to ``command``
+        - ``*.gz`` writes a gzip compressed file
+        - anything else is written as plain text
+    """
+    if filename is None:
+        return MemorySink()
+    if filename.startswith('|'):
+        return PipeSink(filename[1:].strip())
+    if filename.lower().endswith('.gz'):
+        return GzipSink(filename)
+    return FileSink(filename)
@@ -0,0 +1,172 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+Writers for exporting sets and parameters as GAMS symbols, rather than as
+text which GAMS has to parse when the model is compiled.
+"""
+
+import logging
+
+from hydra_base.exceptions import HydraPluginError
+
+from HydraGAMSlib import import_gams_module
+
+log = logging.getLogger(__name__)
+
+
+class SymbolWriter(object):
+    """
+    Base class of the symbol writers used by GAMSExporter.export_symbols.
+
+    Set records are lists of element names, parameter records are tuples of
+    (list of element names, value). GAMS symbol names are not case
+    sensitive, a symbol can only be written once.
+    """
+
+    def __init__(self):
+        self.symbols = set()
+
+    def _check_name(self, name):
+        if name.lower() in self.symbols:
+            log.warning("Symbol %s has already been exported, skipping it.", name)
+            return False
+        self.symbols.add(name.lower())
+        return True
+
+    def add_set(self, name, dim, records, text=''):
+        if self._check_name(name):
+            self._write_set(name, dim, records, text)
+
+    def add_parameter(self, name, dim, records, text=''):
+        if self._check_name(name):
+            self._write_parameter(name, dim, records, text)
+
+    def add_alias(self, name, alias):
+        if self._check_name(alias):
+            self._write_alias(name, alias)
+
+    def _write_set(self, name, dim, records, text):
+        raise NotImplementedError
+
+    def _write_parameter(self, name, dim, records, text):
+        raise NotImplementedError
+
+    def _write_alias(self, name, alias):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GDXSymbolWriter(SymbolWriter):
+    """
+    Write the symbols to a GDX file, which the model reads using $gdxin and
+    $load.
+    """
+
+    def __init__(self, filename, gams_path=None):
+        super(GDXSymbolWriter, self).__init__()
+        self.filename = filename
+        self.gdxcc = import_gams_module('gdxcc', gams_path)
+        self.gdx_handle = self.gdxcc.new_gdxHandle_tp()
+        rc = self.gdxcc.gdxCreate(self.gdx_handle, self.gdxcc.GMS_SSSIZE)
+        if rc[0] == 0:
+            raise HydraPluginError('Could not find GAMS installation.')
+
+        rc = self.gdxcc.gdxOpenWrite(self.gdx_handle, filename, 'Hydra GAMSExport')
+        if rc[0] == 0:
+            raise HydraPluginError('GDX file %s could not be opened for writing.' % filename)
+
+        self.values = self.gdxcc.doubleArray(self.gdxcc.GMS_VAL_MAX)
+        log.info("Writing GDX file %s", filename)
+
+    def _write(self, name, dim, symbol_type, records, text):
+        self.gdxcc.gdxDataWriteStrStart(self.gdx_handle, name, text, dim, symbol_type, 0)
+        for keys, value in records:
+            self.values[self.gdxcc.GMS_VAL_LEVEL] = value
+            self.gdxcc.gdxDataWriteStr(self.gdx_handle, keys, self.values)
+        self.gdxcc.gdxDataWriteDone(self.gdx_handle)
+
+    def _write_set(self, name, dim, records, text):
+        self._write(name, dim, self.gdxcc.GMS_DT_SET,
+                    ((keys, 0) for keys in records), text)
+
+    def _write_parameter(self, name, dim, records, text):
+        self._write(name, dim, self.gdxcc.GMS_DT_PAR, records, text)
+
+    def _write_alias(self, name, alias):
+        self.gdxcc.gdxAddAlias(self.gdx_handle, name, alias)
+
+    def close(self):
+        self.gdxcc.gdxClose(self.gdx_handle)
+        self.gdxcc.gdxFree(self.gdx_handle)
+        log.info("%s symbols written to %s", len(self.symbols), self.filename)
+
+
+class DatabaseSymbolWriter(SymbolWriter):
+    """
+    Add the symbols to a GamsDatabase, which is passed to the job when the
+    model is run, so no file is written or read. A database can't hold
+    aliases, the model has to declare them itself.
+    """
+
+    def __init__(self, database):
+        super(DatabaseSymbolWriter, self).__init__()
+        self.database = database
+
+    def _write_set(self, name, dim, records, text):
+        symbol = self.database.add_set(name, dim, text)
+        for keys in records:
+            symbol.add_record(keys)
+
+    def _write_parameter(self, name, dim, records, text):
+        symbol = self.database.add_parameter(name, dim, text)
+        for keys, value in records:
+            symbol.add_record(keys).value = value
+
+    def _write_alias(self, name, alias):
+        log.info("Alias %s of %s is not added to the database.", alias, name)
+
+
+class SymbolRecorder(SymbolWriter):
+    """
+    Keep the symbols in memory, so that the data of two scenarios can be
+    compared and only the parameters which differ are passed to a model
+    which is solved again from a checkpoint (see GamsModel.run_scenario).
+    """
+
+    def __init__(self):
+        super(SymbolRecorder, self).__init__()
+        self.sets = dict()
+        self.parameters = dict()
+
+    def _write_set(self, name, dim, records, text):
+        self.sets[name.lower()] = (name, dim, list(records), text)
+
+    def _write_parameter(self, name, dim, records, text):
+        self.parameters[name.lower()] = (name, dim, list(records), text)
+
+    def _write_alias(self, name, alias):
+        self.sets[alias.lower()] = (alias, None, name.lower(), '')
+
+    def get_changed_parameters(self, base):
+        """
+        Return the names of the parameters whose records differ from those
+        recorded in ``base``, or None if the sets differ or a parameter is
+        missing in either, as these changes can't be loaded into a model
+        compiled with the data of ``base``.
+        """
+        if self.sets != base.sets or \
+                set(self.parameters) != set(base.parameters):
+            return None
+        return [name for key, (name, dim, records, text)
+                in sorted(self.parameters.items())
+                if base.parameters[key][2] != records]
+
+    def write_parameters(self, writer, names):
+        """
+        Write the parameters ``names`` to another SymbolWriter.
+        """
+        for name in names:
+            name, dim, records, text = self.parameters[name.lower()]
+            writer.add_parameter(name, dim, records, text)
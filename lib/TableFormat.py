@@ -0,0 +1,66 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+Render blocks of numbers as fixed width GAMS table rows.
+
+Like ``numpy.savetxt``, a block is rendered with one format string per row
+instead of formatting every cell on its own, which is what dominates the
+export time of large time series tables.
+"""
+
+from cStringIO import StringIO
+
+import numpy as np
+
+
+def cell_format(width, align='left', conversion='s'):
+    """
+    Return the %-format of a single cell. Right aligned cells always start
+    with a blank, so that long numbers don't run into each other.
+    """
+    if align == 'left':
+        return '%%-%d%s' % (width, conversion)
+    else:
+        return ' %%%d%s' % (width - 1, conversion)
+
+
+def format_table(labels, values, widths, align='left', precision=None,
+                 label_format='%s', line_start='', line_end='\n'):
+    """
+    Render a block of a table.
+
+    :param labels: one label per row.
+    :param values: 2-D array of floats (rows x columns). Missing values
+                   (NaN) are written as nan.
+    :param widths: the width of every column, or a single width used for
+                   all columns.
+    :param align: 'left' or 'right'.
+    :param precision: number of decimals, or None to write the shortest
+                      representation of each value (str(float)).
+    :param label_format: %-format of the row label.
+    :param line_start, line_end: text written before and after each row.
+    :returns: the rendered rows as one string.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values.reshape(1, -1)
+    n_cols = values.shape[1]
+    if isinstance(widths, (int, long)):
+        widths = [widths] * n_cols
+
+    if precision is None:
+        conversion = 's'
+    else:
+        conversion = '.%df' % precision
+
+    row_format = line_start + label_format + \
+        ''.join(cell_format(w, align, conversion) for w in widths) + line_end
+
+    buf = StringIO()
+    for label, row in zip(labels, values.tolist()):
+        if precision is None:
+            buf.write(row_format % tuple([label] + map(str, row)))
+        else:
+            buf.write(row_format % tuple([label] + row))
+
+    return buf.getvalue()
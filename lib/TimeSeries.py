@@ -0,0 +1,117 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+"""
+Batch reindexing of time series datasets to the time axis of the model.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from hydra_base import config
+from hydra_base.util.hydra_dateutil import reindex_timeseries
+
+log = logging.getLogger(__name__)
+
+
+class TimeSeriesMatrix(object):
+    """
+    Hold all time series of an export aligned to a common time axis.
+
+    Every series is parsed once. Numeric single column series are forward
+    filled onto the time axis (the same rule as ``reindex_timeseries``) and
+    stored as one row of a 2-D float array (series x time). Missing values
+    are NaN. Series which can't be stored as floats (array valued or non
+    numeric time series) are kept as lists of values instead.
+    """
+
+    def __init__(self, time_index):
+        self.time_index = list(time_index)
+        self.seasonal_year = int(config.get('DEFAULT', 'seasonal_year', '1678'))
+        self.seasonal_key = str(config.get('DEFAULT', 'seasonal_key', '9999'))
+        self.times = pd.DatetimeIndex(self.time_index).values
+        self.seasonal_times = pd.DatetimeIndex(
+            [t.replace(year=self.seasonal_year) for t in self.time_index]).values
+        self.rows = dict()
+        self.values = np.empty((0, len(self.time_index)))
+        self.other = dict()
+
+    def load(self, series):
+        """
+        Parse and align a list of ``(key, json_value)`` tuples. Keys are used
+        to look up the series afterwards.
+        """
+        series = list(series)
+        self.values = np.empty((len(series), len(self.time_index)))
+        self.values.fill(np.nan)
+        self.rows = dict()
+        self.other = dict()
+
+        n = 0
+        for key, value in series:
+            try:
+                row = self._align(value)
+            except Exception as e:
+                log.exception(e)
+                self.other[key] = None
+                continue
+
+            if isinstance(row, list):
+                self.other[key] = row
+            else:
+                self.values[n] = row
+                self.rows[key] = n
+                n += 1
+
+        self.values = self.values[:n]
+        log.info("%s time series aligned to %s time steps", n, len(self.time_index))
+
+    def _align(self, value):
+        ts = pd.read_json(value.replace(self.seasonal_key, str(self.seasonal_year)))
+
+        if len(ts.columns) != 1 or not isinstance(ts.index, pd.DatetimeIndex) \
+                or ts.dtypes[0].kind not in 'fiu':
+            return self._align_other(value)
+
+        ts = ts.sort_index()
+        if set(ts.index.year) == set([self.seasonal_year]):
+            times = self.seasonal_times
+        else:
+            times = self.times
+
+        # Forward fill: use the last value at or before each time step.
+        positions = np.searchsorted(ts.index.values, times, side='right') - 1
+        data = ts.iloc[:, 0].values.astype(float)
+        row = np.where(positions >= 0, data[positions.clip(0)], np.nan)
+
+        if np.isnan(row).all():
+            raise ValueError("No values found for the time axis.")
+
+        return row
+
+    def _align_other(self, value):
+        converted_ts = reindex_timeseries(value, self.time_index)
+        if len(converted_ts.columns) > 1:
+            return [row.tolist() for row in converted_ts.values]
+        else:
+            return converted_ts.iloc[:, 0].tolist()
+
+    def __contains__(self, key):
+        return key in self.rows or key in self.other
+
+    def get(self, key):
+        """
+        Return the values of a series for every time step as a list, or None
+        if the series could not be read. Missing values are None, as in
+        ``reindex_timeseries``.
+        """
+        if key in self.rows:
+            return [None if v != v else v for v in self.values[self.rows[key]].tolist()]
+        return self.other.get(key)
+
+    def get_row(self, key):
+        """
+        Return the row of a numeric series in the value matrix, or None.
+        """
+        return self.rows.get(key)
@@ -0,0 +1,80 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import argparse as ap
+from datetime import datetime
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+for path in [os.path.join(testdir, '..', 'lib'),
+             os.path.join(testdir, '..', 'Auto')]:
+    path = os.path.realpath(path)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from Exporter import GAMSExporter
+from ExportCache import ExportCache
+import GAMSAutoRun
+
+
+class CachedExporter(GAMSExporter):
+    """An exporter whose network is always found in the cache."""
+
+    def __init__(self, time_axis=None):
+        self.use_gams_date_index = False
+        self.time_index = []
+        self.times_table = {}
+        self.time_axis = time_axis
+
+    def get_network(self, is_licensed, net=None):
+        pass
+
+    def get_cache_key(self, export_by_type=False, output_format='text'):
+        return 'key'
+
+    def export_network(self):
+        raise AssertionError("The network was exported again")
+
+
+class ExportNetworkCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'output.dat')
+        with open(self.output, 'w') as f:
+            f.write('cached data\n')
+        self.args = ap.Namespace(gams_date_time_index=False,
+                                 in_memory=False,
+                                 cache_dir=os.path.join(self.directory,
+                                                        'cache'),
+                                 cache_size='1',
+                                 output=self.output,
+                                 output_format='text',
+                                 export_by_type=False)
+        ExportCache(self.args.cache_dir).put('key', self.output)
+        os.remove(self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cache_hit_without_time_axis(self):
+        exporter = GAMSAutoRun.export_network(self.args, True,
+                                              exporter=CachedExporter())
+        self.assertEqual(exporter.time_index, [])
+        with open(self.output) as f:
+            self.assertEqual(f.read(), 'cached data\n')
+
+    def test_cache_hit_sets_time_index(self):
+        time_axis = [datetime(2000, 1, 1), datetime(2000, 2, 1)]
+        exporter = GAMSAutoRun.export_network(
+            self.args, True, exporter=CachedExporter(time_axis))
+        self.assertEqual(exporter.time_index, time_axis)
+        self.assertEqual(exporter.times_table,
+                         {time_axis[0]: 0, time_axis[1]: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+# (c) Copyright 2013, 2014, 2015 University of Manchester\
+
+import os
+import sys
+import unittest
+
+testdir = os.path.dirname(os.path.realpath(__file__))
+libpath = os.path.realpath(os.path.join(testdir, '..', 'lib'))
+if libpath not in sys.path:
+    sys.path.insert(0, libpath)
+
+from TableFormat import format_table
+
+nan = float('nan')
+
+
+class FormatTableTest(unittest.TestCase):
+    """The tables are the same as those formatted cell by cell."""
+
+    def test_left_aligned(self):
+        values = [[1.5, nan, 3.0], [0.1, 2.0, nan]]
+        expected = ''
+        for label, row in zip(['a', 'b'], values):
+            expected += '\n' + '{0:<8}'.format(label)
+            for value in row:
+                expected += '{0:<8}'.format(str(float(value)))
+        self.assertEqual(format_table(['a', 'b'], values, 8,
+                                      label_format='%-8s',
+                                      line_start='\n', line_end=''),
+                         expected)
+
+    def test_right_aligned(self):
+        values = [[1.5, nan], [nan, 20.25]]
+        expected = ''
+        for label, row in zip(['0', '1'], values):
+            expected += '{0:<7}'.format(label)
+            for value in row:
+                expected += (' %14f' % float(value)).rjust(16)
+            expected += '\n'
+        self.assertEqual(format_table(['0', '1'], values, 16, align='right',
+                                      precision=6, label_format='%-7s'),
+                         expected)
+
+
+if __name__ == '__main__':
+    unittest.main()